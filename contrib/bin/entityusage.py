@@ -0,0 +1,297 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#
+# Reports which entities XML sources use and which they don't
+#
+# Synopsis:
+#   $ entityusage.py [OPTIONS] [-f FILELIST] [FILE...]
+#
+# FILE is an XML source or a DTD or entity file (.dtd, .ent, .mod).
+# FILELIST is the set file list of daps (the XML output of
+# get-all-used-files.xsl) or a list of file names separated by
+# whitespace, like the output of "daps list-srcfiles --noimages";
+# "-" reads it from stdin.
+#
+# The XML sources are read line by line and every general entity
+# reference (except the predefined ones) is recorded with its file and
+# line. References in comments and CDATA sections don't count. The
+# declarations come from the index of listentities.py: from the DOCTYPE
+# declarations of the sources and from the DTD and entity files given.
+# References in the values of declarations count as well.
+#
+# The report lists the unused, the undeclared, and the most used
+# entities. The sources are scanned in parallel, one process per CPU.
+#
+# Copyright (C) 2017 SUSE Linux GmbH
+#
+# Author:
+# Thomas Schraitle <toms at opensuse dot org>
+
+import argparse
+from collections import Counter
+import io
+import json
+import os.path
+import re
+import sys
+
+from listentities import (__version__, EntityIndex, collect,
+                          declared_encoding, default_cachedir, is_dtd)
+
+#: Entities every XML parser knows
+PREDEFINED = frozenset(("amp", "lt", "gt", "quot", "apos"))
+
+# An entity reference or the start or end of a comment or CDATA section
+TOKEN = re.compile(r"<!--|-->|<!\[CDATA\[|\]\]>|&([^\s&;#<>\"']+);")
+
+# Entity references in the values of declarations
+REFERENCE = re.compile(r"&([^\s&;#<>\"']+);")
+
+# The end token of each state
+STATE_END = {"<!--": "-->", "<![CDATA[": "]]>"}
+
+
+def scan_references(filename):
+    """Return the entity references of an XML file
+
+    :param filename: the XML file
+    :return: a dict of entity names to the lines they are used in
+    """
+    references = {}
+    end = None
+    with open(filename, "rb") as fh:
+        # Only the first line can contain the encoding declaration
+        encoding = declared_encoding(fh.readline())
+        fh.seek(0)
+        lines = io.TextIOWrapper(fh, encoding=encoding, errors="replace")
+        for number, line in enumerate(lines, 1):
+            for match in TOKEN.finditer(line):
+                token = match.group()
+                if end is not None:
+                    if token == end:
+                        end = None
+                elif token in STATE_END:
+                    end = STATE_END[token]
+                elif match.group(1) is not None and \
+                        match.group(1) not in PREDEFINED:
+                    references.setdefault(match.group(1), []).append(number)
+    return references
+
+
+def scan_in_worker(filename):
+    """Scan a file in a worker process; errors are returned as a string"""
+    try:
+        return filename, scan_references(filename), None
+    except OSError as error:
+        return filename, {}, str(error)
+
+
+def scan_all(filenames, jobs=0):
+    """Scan all files for entity references, in parallel with jobs > 1
+
+    :param filenames: the XML files
+    :param int jobs: number of worker processes; 0 uses one per CPU
+    :return: yields (filename, references, error) in input order
+    """
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(filenames) <= 1:
+        yield from map(scan_in_worker, filenames)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(jobs) as pool:
+        chunksize = max(1, len(filenames) // (jobs * 4))
+        yield from pool.map(scan_in_worker, filenames, chunksize=chunksize)
+
+
+def read_filelist(filelist):
+    """Return the XML files of a set file list or a list of names"""
+    if filelist == "-":
+        text = sys.stdin.read()
+    else:
+        with open(filelist, encoding="utf-8") as fh:
+            text = fh.read()
+    if not text.lstrip().startswith("<"):
+        return text.split()
+
+    import xml.etree.ElementTree as ET
+
+    root = ET.fromstring(text)
+    return [div.get("href") for div in root.iter("div")
+            if div.get("href") and div.get("text") == "false"]
+
+
+class Usage:
+    """Inverted index of entity references and the declarations
+
+    :param decls: the :class:`listentities.Declaration` objects
+    """
+
+    def __init__(self, decls):
+        self.decls = {}
+        for decl in decls:
+            self.decls.setdefault(decl.name, decl)
+        self.references = {}
+
+    def add(self, filename, references):
+        """Add the references of a file, see :func:`scan_references`"""
+        for name, lines in references.items():
+            self.references.setdefault(name, []).extend(
+                (filename, line) for line in lines)
+
+    def unused(self):
+        """Return the declarations nobody refers to, sorted by name"""
+        return [decl for name, decl in sorted(self.decls.items())
+                if name not in self.references]
+
+    def undeclared(self):
+        """Return the names which are used but not declared, sorted"""
+        return sorted(name for name in self.references
+                      if name not in self.decls)
+
+    def most_used(self, count):
+        """Return the count most used names with their number of uses"""
+        counter = Counter({name: len(refs)
+                           for name, refs in self.references.items()})
+        return counter.most_common(count)
+
+
+def parse_cli(args=None):
+    """Parse CLI arguments
+
+    :param list args: Arguments to parse or None (=use :class:`sys.argv`)
+    :return: parsed arguments
+    :rtype: :class:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(
+        description="Reports which entities XML sources use and which "
+                    "they don't")
+    parser.add_argument("--version",
+                        action="version",
+                        version="%(prog)s " + __version__)
+    parser.add_argument("-f", "--filelist",
+                        help="Set file list or list of file names; "
+                             "- reads it from stdin")
+    parser.add_argument("-e", "--entity",
+                        action="append",
+                        metavar="NAME",
+                        help="Only show the references of NAME; "
+                             "can be used more than once")
+    parser.add_argument("-t", "--top",
+                        type=int,
+                        default=20,
+                        help="Number of most used entities to show "
+                             "(default: %(default)s)")
+    parser.add_argument("--json",
+                        action="store_true",
+                        help="Print the report and all references as JSON")
+    parser.add_argument("-x", "--external-subset",
+                        action="store_true",
+                        help="Also follow the external DTD subset "
+                             "(for example, the DocBook DTD)")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=0,
+                        help="Number of worker processes; 0 uses one "
+                             "per CPU (default: %(default)s)")
+    parser.add_argument("--no-cache",
+                        action="store_true",
+                        help="Neither use nor update the declaration index")
+    parser.add_argument("files",
+                        metavar="FILE",
+                        nargs="*",
+                        help="XML source, DTD, or entity file")
+    args = parser.parse_args(args)
+    if not args.files and not args.filelist:
+        parser.error("Need a FILE or a FILELIST")
+    return args
+
+
+def print_report(usage, top):
+    """Print the unused, undeclared, and most used entities"""
+    unused = usage.unused()
+    print("Unused entities (%d):" % len(unused))
+    for decl in unused:
+        print("  %s\t%s:%d" % (decl.name, decl.file, decl.line))
+
+    undeclared = usage.undeclared()
+    print("Undeclared entities (%d):" % len(undeclared))
+    for name in undeclared:
+        refs = usage.references[name]
+        print("  %s\t%s:%d\t%d use(s)" % (name, *refs[0], len(refs)))
+
+    print("Most used entities:")
+    for name, count in usage.most_used(top):
+        print("  %6d\t%s" % (count, name))
+
+
+def main(cliargs=None):
+    """Entry point for the application script
+
+    :param list cliargs: Arguments to parse or None (=use :class:`sys.argv`)
+    :return: exit status
+    :rtype: int
+    """
+    args = parse_cli(cliargs)
+    sources = [name for name in args.files if not is_dtd(name)]
+    if args.filelist:
+        try:
+            sources += read_filelist(args.filelist)
+        except (OSError, SyntaxError) as error:
+            print("ERROR: %s" % error, file=sys.stderr)
+            return 2
+    # Keep the first of duplicate names
+    sources = list(dict.fromkeys(sources))
+
+    status = 0
+    index = EntityIndex(None if args.no_cache else default_cachedir(),
+                        args.external_subset)
+    declfiles = [name for name in args.files if is_dtd(name)]
+    try:
+        decls = collect(index, declfiles, parameter=False)
+    except OSError as error:
+        print("ERROR: %s" % error, file=sys.stderr)
+        return 2
+
+    usage = Usage(decls)
+    for filename, references, error in scan_all(sources, args.jobs):
+        if error is not None:
+            print("ERROR: %s" % error, file=sys.stderr)
+            status = 2
+            continue
+        usage.add(filename, references)
+        for decl in index.declarations(filename):
+            if not decl.parameter:
+                usage.decls.setdefault(decl.name, decl)
+
+    # Entities used by the values of other entities, except in the
+    # sources, which were scanned completely
+    scanned = set(sources)
+    for decl in [*usage.decls.values()]:
+        if decl.value is None or decl.file in scanned:
+            continue
+        for match in REFERENCE.finditer(decl.value):
+            if match.group(1) not in PREDEFINED:
+                usage.references.setdefault(match.group(1), []).append(
+                    (decl.file, decl.line))
+
+    if args.entity:
+        for name in args.entity:
+            for filename, line in usage.references.get(name, []):
+                print("%s\t%s:%d" % (name, filename, line))
+    elif args.json:
+        json.dump(dict(unused=[decl.name for decl in usage.unused()],
+                       undeclared=usage.undeclared(),
+                       references=usage.references),
+                  sys.stdout, indent=2)
+        print()
+    else:
+        print_report(usage, args.top)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# EOF
@@ -1,137 +1,483 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 #
-# Lists all entities from an XML file
+# Lists the entities declared for XML files
 #
 # Synopsis:
-#   $ listentities.py XMLFILE
+#   $ listentities.py [OPTIONS] FILE...
+#
+# FILE is an XML document or a DTD or entity file (.dtd, .ent, .mod).
+# For documents, the internal subset of the DOCTYPE declaration is
+# scanned and every external parameter entity it references is
+# followed, like a parser would do it.
+#
+# The declarations of each DTD and entity file are stored in an index
+# in $XDG_CACHE_HOME/daps/entities, keyed by the SHA-256 hash of the
+# file content. Only new or changed files are scanned again; set
+# DAPS_ENTITY_CACHE=0 or use --no-cache to disable the index.
+#
+# The prolog of documents is read and external entities are resolved
+# with getentityname.py from the libexec directory of daps, with the
+# XML catalog loaded in-process.
 #
 # HINTS:
-# Currently, command line parsing doesn't occur. There are no
-# --help|-h options.
+# The declarations are found with regular expressions, not with a
+# validating parser. Parameter entities with an internal value are not
+# expanded, and conditional sections are treated as INCLUDE unless
+# they literally say IGNORE.
 #
 # Copyright (C) 2017 SUSE Linux GmbH
 #
 # Author:
 # Thomas Schraitle <toms at opensuse dot org>
 
-import io
-from lxml import etree
-import lxml.sax
+import argparse
+import codecs
+from collections import namedtuple
+import hashlib
+import importlib.util
+import json
+import logging
 import os.path
-import subprocess
+import re
 import sys
-import xml.sax
+import tempfile
+from urllib.parse import unquote, urlparse
 
+__version__ = "0.2.0"
 
-# Inheriting from EntityResolver and DTDHandler is not necessary
-class TestHandler(lxml.sax.ContentHandler):
-    def __init__(self):
-        super().__init__()
-        self.extentities = []
+#: Change when the format of the index entries changes
+INDEX_VERSION = "1"
 
-    # This method is only called for external entities. Must return a value.
-    def resolveEntity(self, publicID, systemID):
-        print("TestHandler.resolveEntity(): %s %s" % (publicID, systemID),
-              file=sys.stderr)
-        self.extentities.append((publicID, systemID))
-        return systemID
+#: Environment variable to disable the index with "0"
+CACHE_ENV = "DAPS_ENTITY_CACHE"
 
+#: Files with these extensions are DTD or entity files
+DTD_EXTENSIONS = (".dtd", ".ent", ".mod")
 
-def resolveURL(url, *, timeout=None, check=False):
-    with subprocess.Popen(["xmlcatalog", "/etc/xml/catalog", url],
-                          stdout=subprocess.PIPE) as process:
-        try:
-            stdout, stderr = process.communicate(timeout=timeout)
-        except subprocess.TimeoutExpired:
-            process.kill()
-            stdout, stderr = process.communicate()
-            raise subprocess.TimeoutExpired(process.args,
-                                            timeout,
-                                            output=stdout,
-                                            stderr=stderr)
-        except:
-            process.kill()
-            process.wait()
-            raise
-        retcode = process.poll()
-        if check and retcode:
-            raise subprocess.CalledProcessError(retcode,
-                                                process.args,
-                                                output=stdout,
-                                                # stderr=stderr
-                                                )
-    return (stdout, stderr)
-
-
-def expat(filename):
-    parser = xml.sax.make_parser()
-    handler = TestHandler()
-    parser.setContentHandler(handler)
-    parser.setEntityResolver(handler)
-    parser.setDTDHandler(handler)
-    #
-    # parser.setFeature(xml.sax.handler.feature_validation, True)
-    parser.setFeature(xml.sax.handler.feature_external_ges, True)
-    # parser.setProperty(xml.sax.handler.property_declaration_handler, handler)
-
-    parser.parse(filename)
-    return handler.extentities
-
-
-def iterentities(dtdfile):
-    print("Parsing %r..." % dtdfile, file=sys.stderr)
-    try:
-        dtd = etree.DTD(dtdfile)
-        yield from dtd.iterentities()
-    except etree.DTDParseError:
-        # Hmn, should we do that?
-        pass
+#: Size of the chunks when reading the prolog of a document
+CHUNK_SIZE = 1 << 16
+
+#: The libexec directory of daps
+LIBEXEC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__)))),
+    "libexec")
+
+Declaration = namedtuple("Declaration",
+                         "name value public system file line parameter")
+
+
+def quoted(name):
+    """Return a regex for a quoted literal with the groups name and name_"""
+    return rf'''(?:"(?P<{name}>[^"]*)"|'(?P<{name}_>[^']*)')'''
 
 
-def main(filename):
-    names = set()
+def literal(match, name):
+    """Return the content of a literal matched by :func:`quoted`"""
+    value = match.group(name)
+    return match.group(name + "_") if value is None else value
+
+
+# One token of a DTD; everything between the tokens is ignored
+DTD_TOKEN = re.compile(rf"""
+    (?P<comment><!--.*?-->)
+  | (?P<pi><\?.*?\?>)
+  | <!ENTITY\s+(?:(?P<percent>%)\s+)?(?P<name>[^\s%;>]+)\s+
+    (?:{quoted('value')}
+      | (?:SYSTEM|PUBLIC\s+{quoted('public')})\s+{quoted('system')}
+    )[^>]*>
+  | (?P<ignore><!\[\s*IGNORE\s*\[.*?\]\]>)
+  | (?P<section><!\[[^\[]*\[|\]\]>)
+  | (?P<decl><!(?:[^>"']|"[^"]*"|'[^']*')*>)
+  | %(?P<ref>[^\s%;]+);
+  | (?P<end>\])
+""", re.S | re.X)
+
+# The DOCTYPE declaration at the start of a document, up to the
+# beginning of the internal subset
+DOCTYPE = re.compile(rf"""
+    \ufeff?(?:\s+|<\?.*?\?>|<!--.*?-->)*
+    <!DOCTYPE\s+[^\s\[>]+
+    (?:\s+(?:SYSTEM|PUBLIC\s+{quoted('public')})\s+{quoted('system')})?
+    \s*(?P<subset>\[)?
+""", re.S | re.X)
+
+# The encoding in the XML or text declaration
+ENCODING = re.compile(rb"""^(?:\xef\xbb\xbf)?<\?xml[^>]*?encoding\s*=\s*["']([^"']+)""")
+
+
+def declared_encoding(data):
+    """Return the encoding declared at the start of data or UTF-8
+
+    :param bytes data: the start of a file, at least its first line
+    """
+    match = ENCODING.match(data)
+    if match is None:
+        return "utf-8"
+    encoding = match.group(1).decode("ascii")
     try:
-        extentities = expat(filename)
-        for public, system in extentities:
-            identifier = system if public is None else public
-            print("Trying to resolve %r..." % identifier, file=sys.stderr)
-            print("Using %r" % extentities[:3], file=sys.stderr)
+        codecs.lookup(encoding)
+    except LookupError:
+        return "utf-8"
+    return encoding
+
+
+def decode(data):
+    """Decode the content of a file with the encoding it declares"""
+    return data.decode(declared_encoding(data), errors="replace")
+
+
+def scan(text, pos=0, subset=False):
+    """Scan DTD text for entity declarations and parameter entity references
+
+    The events are lists, so they can be stored as JSON:
+    ["decl", name, value, public, system, line, parameter] and
+    ["ref", name, line].
+
+    :param text: the DTD text
+    :param pos: the offset to start at
+    :param subset: stop at the "]" which ends an internal subset
+    :return: the events and the offset where the scan stopped
+    """
+    events = []
+    line = text.count("\n", 0, pos) + 1
+    last = pos
+    for match in DTD_TOKEN.finditer(text, pos):
+        line += text.count("\n", last, match.start())
+        last = match.start()
+        if match.group("name") is not None:
+            events.append(["decl", match.group("name"),
+                           literal(match, "value"), literal(match, "public"),
+                           literal(match, "system"), line,
+                           match.group("percent") is not None])
+        elif match.group("ref") is not None:
+            events.append(["ref", match.group("ref"), line])
+        elif match.group("end") is not None and subset:
+            return events, match.end()
+    return events, len(text)
+
+
+def import_getentityname():
+    """Import getentityname.py from LIBEXEC_DIR"""
+    spec = importlib.util.spec_from_file_location(
+        "getentityname", os.path.join(LIBEXEC_DIR, "getentityname.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    # Unresolved entities are reported here
+    logging.getLogger(module.LOGGERNAME).addHandler(logging.NullHandler())
+    return module
+
+
+getentityname = import_getentityname()
+
+
+def read_prolog(filename):
+    """Return the start of a document up to the end of its DOCTYPE declaration
+
+    The file is read in chunks until the end of the internal subset.
+    """
+    with open(filename, "rb") as fh:
+        return getentityname.read_prolog(fh, CHUNK_SIZE)
+
+
+def document_events(filename):
+    """Return the events of the internal subset and the external subset
+
+    :param filename: the XML document
+    :return: the events and a (public, system) tuple of the external
+             subset or None
+    """
+    text = read_prolog(filename)
+    match = DOCTYPE.match(text)
+    if match is None:
+        return [], None
+    external = None
+    if literal(match, "system") is not None:
+        external = (literal(match, "public"), literal(match, "system"))
+    if not match.group("subset"):
+        return [], external
+    events, _ = scan(text, match.end(), subset=True)
+    return events, external
+
+
+def is_dtd(filename):
+    """Return True if the file is a DTD or entity file"""
+    return filename.endswith(DTD_EXTENSIONS)
 
-            try:
-                stdout, stderr = resolveURL(identifier, check=True)
-                identifier = stdout
-            except subprocess.CalledProcessError as error:
-                print("ERROR:", error, file=sys.stderr)
-                identifier = system
 
+def default_cachedir():
+    """Return the default directory of the index or None"""
+    if os.environ.get(CACHE_ENV) == "0":
+        return None
+    cachehome = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache")
+    return os.path.join(cachehome, "daps", "entities")
+
+
+def url_to_path(url, base):
+    """Return the local path of a system identifier or None"""
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return unquote(parsed.path)
+    if parsed.scheme and len(parsed.scheme) > 1:
+        # Remote, but allow Windows drive letters
+        return None
+    return os.path.normpath(os.path.join(os.path.dirname(base), url))
+
+
+class EntityIndex:
+    """Entity declarations of DTD and entity files
+
+    The events of every file (see :func:`scan`) are stored as a JSON
+    file named after the hash of the file content. The events don't
+    contain the path of the file, so copies of the same file share
+    one entry.
+
+    External entities are resolved with the XML catalog; the results
+    are cached in the catalog cache of getentityname.py unless the index
+    is disabled.
+
+    :param cachedir: the directory of the index or None
+    :param external_subset: also follow the external DTD subset of
+                            documents
+    :param catalog: the XML catalog file
+    """
+
+    def __init__(self, cachedir=None, external_subset=False,
+                 catalog=getentityname.MAINCATALOG):
+        self.cachedir = cachedir and os.path.join(cachedir, INDEX_VERSION)
+        self.external_subset = external_subset
+        self.catalog = catalog
+        self.catalogcache = None
+        self.events = {}
+        self.resolved = {}
+
+    def path(self, digest):
+        """Return the path of the index entry of a hash"""
+        return os.path.join(self.cachedir, digest[:2], digest + ".json")
+
+    def load(self, digest):
+        """Return the stored events of a hash or None"""
+        if self.cachedir is None:
+            return None
+        try:
+            with open(self.path(digest), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, digest, events):
+        """Store the events of a hash; errors are ignored"""
+        if self.cachedir is None:
+            return
+        path = self.path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+                                       suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(events, fh)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def file_events(self, filename):
+        """Return the events of a DTD or entity file"""
+        events = self.events.get(filename)
+        if events is None:
+            with open(filename, "rb") as fh:
+                data = fh.read()
+            digest = hashlib.sha256(data).hexdigest()
+            events = self.load(digest)
+            if events is None:
+                events, _ = scan(decode(data))
+                self.store(digest, events)
+            self.events[filename] = events
+        return events
+
+    def resolve(self, base, public, system):
+        """Return the local path of an external entity or None
+
+        The system identifier is tried relative to the declaring file
+        first, then the XML catalog is asked.
+        """
+        path = url_to_path(system, base)
+        if path is not None and os.path.exists(path):
+            return path
+        identifier = system if public is None else public
+        if identifier not in self.resolved:
+            if self.catalogcache is None and self.cachedir is not None and \
+                    os.environ.get(getentityname.CACHE_ENV) != "0":
+                self.catalogcache = getentityname.CatalogCache([self.catalog])
             try:
-                identifier = identifier.strip().decode("utf-8")
-            except:
-                pass
-            if identifier.startswith('file:'):
-                identifier = identifier[5:]
+                result = getentityname.xmlcatalog(identifier, self.catalog,
+                                                  cache=self.catalogcache)
+            except getentityname.XMLCatalogError:
+                result = None
+            self.resolved[identifier] = result and url_to_path(result, base)
+        return self.resolved[identifier]
+
+    def declarations(self, filename):
+        """Return the effective entity declarations for a file
+
+        Like in XML, the first declaration of a name is the one which
+        counts; later ones are not returned.
+
+        :param filename: an XML document or a DTD or entity file
+        :return: the :class:`Declaration` objects in the order of
+                 the declarations
+        """
+        declared = {}
+        seen = {filename}
+        if is_dtd(filename):
+            self.follow(filename, self.file_events(filename), declared, seen)
+            return list(declared.values())
+
+        events, external = document_events(filename)
+        self.follow(filename, events, declared, seen)
+        if external is not None and self.external_subset:
+            path = self.resolve(filename, *external)
+            if path is not None:
+                self.follow_file(path, declared, seen)
+        return list(declared.values())
+
+    def follow(self, filename, events, declared, seen):
+        """Collect the declarations of events and the files they reference"""
+        for event in events:
+            if event[0] == "decl":
+                _, name, value, public, system, line, parameter = event
+                declared.setdefault(
+                    (parameter, name),
+                    Declaration(name, value, public, system, filename, line,
+                                parameter))
+                continue
+            decl = declared.get((True, event[1]))
+            if decl is None or decl.system is None:
+                continue
+            path = self.resolve(decl.file, decl.public, decl.system)
+            if path is None:
+                print("WARNING: %s:%d: cannot resolve %r" % (
+                      filename, event[2], decl.public or decl.system),
+                      file=sys.stderr)
+            else:
+                self.follow_file(path, declared, seen)
+
+    def follow_file(self, path, declared, seen):
+        """Collect the declarations of a referenced file once"""
+        if path in seen:
+            return
+        seen.add(path)
+        try:
+            events = self.file_events(path)
+        except OSError as error:
+            print("WARNING: %s" % error, file=sys.stderr)
+            return
+        self.follow(path, events, declared, seen)
+
+
+def collect(index, filenames, parameter=False):
+    """Return the declarations of all files without duplicates"""
+    result = {}
+    for filename in filenames:
+        for decl in index.declarations(filename):
+            if decl.parameter and not parameter:
+                continue
+            result.setdefault((decl.name, decl.file, decl.line), decl)
+    return sorted(result.values(), key=lambda decl: (decl.name, decl.file,
+                                                     decl.line))
+
+
+def format_declaration(decl):
+    """Return a declaration as a line with name, location, and value"""
+    if decl.system is not None:
+        value = "SYSTEM %r" % decl.system
+    else:
+        value = repr(decl.value)
+    name = ("%" if decl.parameter else "") + decl.name
+    return "%s\t%s:%d\t%s" % (name, decl.file, decl.line, value)
+
+
+def parse_cli(args=None):
+    """Parse CLI arguments
+
+    :param list args: Arguments to parse or None (=use :class:`sys.argv`)
+    :return: parsed arguments
+    :rtype: :class:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(
+        description="Lists the entities declared for XML files")
+    parser.add_argument("--version",
+                        action="version",
+                        version="%(prog)s " + __version__)
+    parser.add_argument("-l", "--long",
+                        action="store_true",
+                        help="Show the file, line, and value of each entity")
+    parser.add_argument("--json",
+                        action="store_true",
+                        help="Print the declarations as JSON")
+    parser.add_argument("-e", "--entity",
+                        action="append",
+                        metavar="NAME",
+                        help="Only show the declarations of NAME; "
+                             "can be used more than once")
+    parser.add_argument("-p", "--parameter",
+                        action="store_true",
+                        help="Include parameter entities")
+    parser.add_argument("-x", "--external-subset",
+                        action="store_true",
+                        help="Also follow the external DTD subset "
+                             "(for example, the DocBook DTD)")
+    parser.add_argument("--no-cache",
+                        action="store_true",
+                        help="Neither use nor update the index and the "
+                             "catalog cache")
+    parser.add_argument("files",
+                        metavar="FILE",
+                        nargs="+",
+                        help="XML document, DTD, or entity file")
+    return parser.parse_args(args)
+
+
+def main(cliargs=None):
+    """Entry point for the application script
+
+    :param list cliargs: Arguments to parse or None (=use :class:`sys.argv`)
+    :return: exit status
+    :rtype: int
+    """
+    args = parse_cli(cliargs)
+    index = EntityIndex(None if args.no_cache else default_cachedir(),
+                        args.external_subset)
+    try:
+        decls = collect(index, args.files, args.parameter)
+    except OSError as error:
+        print("ERROR: %s" % error, file=sys.stderr)
+        return 2
 
-            if not os.path.isabs(identifier):
-                # print("Trying to join: "
-                #       "%r with %r" % (os.path.dirname(filename),
-                #                       identifier),
-                #                       file=sys.stderr)
-                identifier = os.path.join(os.path.dirname(filename),
-                                          identifier)
-            for ent in iterentities(identifier):
-                # print(ent.name, end=" ", file=sys.stderr)
-                names.add(ent.name)
+    missing = []
+    if args.entity:
+        wanted = set(args.entity)
+        decls = [decl for decl in decls if decl.name in wanted]
+        missing = sorted(wanted - {decl.name for decl in decls})
 
-        return names
+    if args.json:
+        json.dump([decl._asdict() for decl in decls], sys.stdout, indent=2)
+        print()
+    elif args.long or args.entity:
+        for decl in decls:
+            print(format_declaration(decl))
+    else:
+        for name in sorted({decl.name for decl in decls}):
+            print(name)
 
-    except xml.sax.SAXParseException as e:
-        print("*** PARSER error: %s" % e, file=sys.stderr)
+    for name in missing:
+        print("ERROR: entity %r is not declared" % name, file=sys.stderr)
+    return 1 if missing else 0
 
 
 if __name__ == "__main__":
-    names = main(sys.argv[1])
-    # print("-"*20)
-    print(sorted(names))
+    sys.exit(main())
 
 # EOF
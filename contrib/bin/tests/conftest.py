@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cachehome(tmp_path, monkeypatch):
+    """Keep the persistent caches inside the temporary directory"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cachehome"))
@@ -0,0 +1 @@
+../entityusage.py
\ No newline at end of file
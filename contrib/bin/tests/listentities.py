@@ -0,0 +1 @@
+../listentities.py
\ No newline at end of file
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+# The scripts of contrib/bin are linked here, so they can be imported
+import entityusage
+
+
+def test_scan_references_skips_comments_and_cdata(tmp_path):
+    # Given
+    xmlfile = tmp_path / "doc.xml"
+    xmlfile.write_text("""<?xml version="1.0"?>
+<doc>&one; <!-- &commented;
+  still &commented; --> &two;
+ <![CDATA[ &cdata;
+ ]]>&three;&amp;&lt;&gt;&quot;&apos;&#x20;&#32;
+ <!-- --> &four; &one;
+</doc>
+""", encoding="utf-8")
+
+    # When
+    references = entityusage.scan_references(str(xmlfile))
+
+    # Then
+    assert references == dict(one=[2, 6], two=[3], three=[5], four=[6])
+
+
+def test_scan_references_with_declared_encoding(tmp_path):
+    # Given
+    xmlfile = tmp_path / "doc.xml"
+    xmlfile.write_bytes('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+                        "<doc>\n&caf\xe9;\n</doc>\n".encode("latin-1"))
+
+    # When
+    references = entityusage.scan_references(str(xmlfile))
+
+    # Then
+    assert references == {"caf\xe9": [3]}
+
+
+def test_scan_references_unknown_encoding(tmp_path):
+    # Given
+    xmlfile = tmp_path / "doc.xml"
+    xmlfile.write_text('<?xml version="1.0" encoding="x-unknown"?>\n'
+                       "<doc>&name;</doc>\n", encoding="utf-8")
+
+    # When
+    references = entityusage.scan_references(str(xmlfile))
+
+    # Then
+    assert references == dict(name=[2])
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    """A document and an entity file; one entity is not used, one isn't
+    declared, and one is only used by another entity"""
+    (tmp_path / "doc.ent").write_text("""<!ENTITY product "Product">
+<!ENTITY version "1.0">
+<!ENTITY full "&product; &version;">
+<!ENTITY unused "Unused">
+""", encoding="utf-8")
+    (tmp_path / "doc.xml").write_text("""<?xml version="1.0"?>
+<!DOCTYPE doc [
+  <!ENTITY % entities SYSTEM "doc.ent">
+  %entities;
+  <!ENTITY local "Local">
+]>
+<doc>&full; &local; &undeclared; &amp;
+ <!-- &unused; -->
+</doc>
+""", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_main_json(sources, capsys):
+    # When
+    result = entityusage.main(["--no-cache", "--json", "doc.xml"])
+
+    # Then
+    report = json.loads(capsys.readouterr().out)
+    assert result == 0
+    assert report["unused"] == ["unused"]
+    assert report["undeclared"] == ["undeclared"]
+    assert report["references"]["version"] == [["doc.ent", 3]]
+    assert sorted(report["references"]) == [
+        "full", "local", "product", "undeclared", "version"]
+
+
+def test_main_report(sources, capsys):
+    # When
+    result = entityusage.main(["--no-cache", "--top", "2", "doc.xml"])
+
+    # Then
+    out = capsys.readouterr().out
+    assert result == 0
+    assert "Unused entities (1):\n  unused\tdoc.ent:4\n" in out
+    assert "Undeclared entities (1):\n  undeclared\tdoc.xml:7\t1 use(s)\n" \
+        in out
+
+
+def test_main_missing_source(sources, capsys):
+    # When
+    result = entityusage.main(["--no-cache", "doc.xml", "missing.xml"])
+
+    # Then
+    assert result == 2
+    assert "missing.xml" in capsys.readouterr().err
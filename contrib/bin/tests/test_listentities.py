@@ -0,0 +1,156 @@
+import pytest
+
+# The scripts of contrib/bin are linked here, so they can be imported
+import listentities
+
+ENTITIES = """<!ENTITY product "Product">
+<!ENTITY % more SYSTEM "more.ent">
+%more;
+"""
+
+
+@pytest.fixture
+def entityfiles(tmp_path):
+    """Two copies of an entity file which references another one"""
+    for name in ("a.ent", "b.ent"):
+        (tmp_path / name).write_text(ENTITIES, encoding="utf-8")
+    (tmp_path / "more.ent").write_text('<!ENTITY version "1.0">\n',
+                                       encoding="utf-8")
+    return tmp_path
+
+
+def names(decls):
+    return [decl.name for decl in decls]
+
+
+def test_index_stores_events_by_hash(entityfiles, tmp_path, monkeypatch):
+    # Given
+    cachedir = str(tmp_path / "cache")
+    listentities.EntityIndex(cachedir).declarations(
+        str(entityfiles / "a.ent"))
+    scanned = []
+    scan = listentities.scan
+
+    def spy(text, *args, **kwargs):
+        scanned.append(text)
+        return scan(text, *args, **kwargs)
+
+    monkeypatch.setattr(listentities, "scan", spy)
+
+    # When
+    index = listentities.EntityIndex(cachedir)
+    first = index.declarations(str(entityfiles / "a.ent"))
+    copy = index.declarations(str(entityfiles / "b.ent"))
+
+    # Then
+    # The copy has the same hash, so nothing is scanned again
+    assert scanned == []
+    assert names(first) == names(copy) == ["product", "more", "version"]
+    assert copy[0].file == str(entityfiles / "b.ent")
+    assert copy[2].file == str(entityfiles / "more.ent")
+
+
+def test_index_scans_changed_file(entityfiles, tmp_path):
+    # Given
+    cachedir = str(tmp_path / "cache")
+    listentities.EntityIndex(cachedir).declarations(
+        str(entityfiles / "a.ent"))
+
+    # When
+    (entityfiles / "more.ent").write_text('<!ENTITY release "2">\n',
+                                          encoding="utf-8")
+    decls = listentities.EntityIndex(cachedir).declarations(
+        str(entityfiles / "a.ent"))
+
+    # Then
+    assert names(decls) == ["product", "more", "release"]
+
+
+def test_index_with_broken_entry(entityfiles, tmp_path):
+    # Given
+    cachedir = str(tmp_path / "cache")
+    index = listentities.EntityIndex(cachedir)
+    index.declarations(str(entityfiles / "more.ent"))
+    for entry in (tmp_path / "cache").glob("*/*/*.json"):
+        entry.write_text("[", encoding="utf-8")
+
+    # When
+    decls = listentities.EntityIndex(cachedir).declarations(
+        str(entityfiles / "more.ent"))
+
+    # Then
+    assert names(decls) == ["version"]
+
+
+def test_index_without_cachedir(entityfiles, tmp_path):
+    # When
+    decls = listentities.EntityIndex(None).declarations(
+        str(entityfiles / "a.ent"))
+
+    # Then
+    assert names(decls) == ["product", "more", "version"]
+    assert list(tmp_path.glob("**/*.json")) == []
+
+
+def test_document_with_long_internal_subset(tmp_path):
+    # Given
+    filler = "<!-- %s -->\n" % ("x" * 100)
+    xmlfile = tmp_path / "doc.xml"
+    xmlfile.write_text('<?xml version="1.0"?>\n<!DOCTYPE doc [\n'
+                       + filler * 1000
+                       + '<!ENTITY late "]> in a literal">\n]>\n<doc>'
+                       + "<para>&late;</para>\n" * 10000 + "</doc>\n",
+                       encoding="utf-8")
+
+    # When
+    prolog = listentities.read_prolog(str(xmlfile))
+    decls = listentities.EntityIndex(None).declarations(str(xmlfile))
+
+    # Then
+    assert len(prolog) > listentities.CHUNK_SIZE
+    assert prolog.endswith("]>")
+    assert [(decl.name, decl.value, decl.line) for decl in decls] == [
+        ("late", "]> in a literal", 1003)]
+
+
+def test_resolve_with_catalog(tmp_path):
+    # Given
+    (tmp_path / "dtd").mkdir()
+    (tmp_path / "dtd" / "found.ent").write_text('<!ENTITY found "yes">\n',
+                                                encoding="utf-8")
+    catalog = tmp_path / "catalog.xml"
+    catalog.write_text(
+        '<catalog xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog">\n'
+        '  <public publicId="-//TEST//ENTITIES Found//EN"'
+        ' uri="dtd/found.ent"/>\n'
+        "</catalog>\n", encoding="utf-8")
+    (tmp_path / "doc.ent").write_text(
+        '<!ENTITY % found PUBLIC "-//TEST//ENTITIES Found//EN"'
+        ' "http://example.org/found.ent">\n%found;\n', encoding="utf-8")
+    index = listentities.EntityIndex(str(tmp_path / "cache"),
+                                     catalog=str(catalog))
+
+    # When
+    decls = index.declarations(str(tmp_path / "doc.ent"))
+
+    # Then
+    assert names(decls) == ["found", "found"]
+    assert decls[1].file == str(tmp_path / "dtd" / "found.ent")
+    assert index.catalogcache.get("-//TEST//ENTITIES Found//EN")
+
+
+def test_resolve_unknown_identifier(tmp_path, capsys):
+    # Given
+    (tmp_path / "doc.ent").write_text(
+        '<!ENTITY % missing SYSTEM "http://example.org/missing.ent">\n'
+        "%missing;\n", encoding="utf-8")
+    index = listentities.EntityIndex(None,
+                                     catalog=str(tmp_path / "missing.xml"))
+
+    # When
+    decls = index.declarations(str(tmp_path / "doc.ent"))
+
+    # Then
+    assert names(decls) == ["missing"]
+    assert "cannot resolve 'http://example.org/missing.ent'" in \
+        capsys.readouterr().err
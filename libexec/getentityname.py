@@ -34,12 +34,15 @@ the above example, the "bar.ent" is therefor not in the result list.
 """
 
 import argparse
+from collections import deque, namedtuple
+import hashlib
+import json
 import logging
 import os.path
 import re
-import subprocess
 import sys
-from logging.config import dictConfig
+from urllib.parse import unquote, urljoin, urlparse
+from xml.etree import ElementTree
 from xml.sax import SAXParseException, make_parser
 import xml.sax.handler as xmlsh
 
@@ -113,17 +116,333 @@ DOCTYPE = (
     """{opS}>"""
 ).format(**locals())
 r_DOCTYPE = re.compile(DOCTYPE, re.VERBOSE | re.DOTALL | re.MULTILINE)
-COMMENTOPEN = re.compile("<!--")
-COMMENTCLOSE = re.compile("-->")
+
+# Regular expressions for the prolog scanner, working on bytes
+#: Encoding in the XML declaration
+r_XMLENCODING = re.compile(
+    rb"""<\?xml[^>]*?encoding%s=%s["']([A-Za-z][-A-Za-z0-9._]*)["']"""
+    % (opS.encode(), opS.encode())
+)
+#: Markup in the internal subset which may contain a "]"
+r_SUBSETMARKUP = re.compile(rb"""\]|'|"|<!--|<\?""")
+#: Length of the longest token of r_SUBSETMARKUP minus one
+SUBSETMARKUP_OVERLAP = 3
+
+#: Size of the blocks read by the prolog scanner
+BLOCKSIZE = 4096
 
 #: The main catalog (default)
 MAINCATALOG = "/etc/xml/catalog"
 
+#: The namespace of OASIS XML catalogs
+CATALOG_NS = "urn:oasis:names:tc:entity:xmlns:xml:catalog"
+
+#: The xml:base attribute in Clark notation
+XMLBASE = "{http://www.w3.org/XML/1998/namespace}base"
+
+#: Maximum depth of nextCatalog/delegate chains (same limit as libxml2)
+MAX_CATALOG_DEPTH = 50
+
+#: Map catalog entry name to (matched attribute, value attribute)
+CATALOG_ENTRIES = {
+    "public": ("publicId", "uri"),
+    "system": ("systemId", "uri"),
+    "uri": ("name", "uri"),
+    "rewriteSystem": ("systemIdStartString", "rewritePrefix"),
+    "rewriteURI": ("uriStartString", "rewritePrefix"),
+    "systemSuffix": ("systemIdSuffix", "uri"),
+    "uriSuffix": ("uriSuffix", "uri"),
+    "delegatePublic": ("publicIdStartString", "catalog"),
+    "delegateSystem": ("systemIdStartString", "catalog"),
+    "delegateURI": ("uriStartString", "catalog"),
+}
+
+#: Characters which let xmlcatalog treat an identifier as public ID
+r_NOURI = re.compile(r"[\s\"<>{}|\\^`]")
+
+#: Translation table to unwrap urn:publicid: URNs (RFC 3151)
+PUBLICID_URN = "urn:publicid:"
+r_PUBLICID_URN = re.compile(r"%2B|%3A|%2F|%3B|%27|%3F|%23|%25|[+:;]",
+                            re.IGNORECASE)
+URN_UNWRAP = {
+    "+": " ", ":": "//", ";": "::",
+    "%2B": "+", "%3A": ":", "%2F": "/", "%3B": ";",
+    "%27": "'", "%3F": "?", "%23": "#", "%25": "%",
+}
+
+#: Marker for a failed delegation; stops the search in any further catalog
+BREAK = object()
+
+#: A catalog entry which is compared by prefix or suffix
+CatalogMatch = namedtuple("CatalogMatch", ["match", "value", "prefer"])
+
+#: Catalog references (nextCatalog and delegate*) for the cache stamp
+r_CATALOGREF = re.compile(r"""\bcatalog=("[^"]*"|'[^']*')""")
+
+#: Environment variable to disable the catalog cache (if set to "0")
+CACHE_ENV = "DAPS_CATALOG_CACHE"
+
+#: How a node of the entity graph was found
+ORIGIN_XML = "xml"  # one of the XML input files
+ORIGIN_LOCAL = "local"  # local system ID, relative to the referencing file
+ORIGIN_PUBLIC = "public"  # public ID, resolved via catalog
+ORIGIN_CATALOG = "catalog"  # http(s) system ID, resolved via catalog
+
+#: A node of the entity graph
+EntityNode = namedtuple("EntityNode", ["path", "origin", "identifier"])
+
 
 class XMLCatalogError(LookupError):
     pass
 
 
+def normalize_publicid(publicid):
+    """Normalize a public identifier like libxml2 does
+
+    Whitespace is collapsed and urn:publicid: URNs are unwrapped.
+
+    :param str publicid: the public identifier
+    :return: the normalized public identifier
+    :rtype: str
+
+    >>> normalize_publicid("  -//TOMS//DTD   Test//EN ")
+    '-//TOMS//DTD Test//EN'
+    >>> normalize_publicid("urn:publicid:-:TOMS:DTD+Test:EN")
+    '-//TOMS//DTD Test//EN'
+    """
+    if publicid.startswith(PUBLICID_URN):
+        publicid = r_PUBLICID_URN.sub(
+            lambda match: URN_UNWRAP[match.group(0).upper()],
+            publicid[len(PUBLICID_URN):],
+        )
+    return " ".join(publicid.split())
+
+
+def catalogpath(url):
+    """Convert a catalog reference (path or file: URL) into a local path
+
+    :param str url: path or URL of the catalog
+    :return: the local path or None if it isn't a local file
+    """
+    if url.startswith("file:"):
+        return unquote(urlparse(url).path)
+    if urlparse(url).scheme:
+        return None
+    return url
+
+
+class XMLCatalog:
+    """In-memory index of a single OASIS XML catalog file
+
+    The catalog file is parsed once and all entries are stored in
+    dictionaries (exact matches) or lists (prefix and suffix matches).
+    Catalogs referenced by ``nextCatalog`` and ``delegate*`` entries are
+    loaded lazily through :func:`load_catalog` and shared between all
+    catalogs.
+
+    The resolution follows the algorithm of libxml2 which is used by
+    the ``xmlcatalog`` command.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.public = {}
+        self.system = {}
+        self.uri = {}
+        self.rewrite = {"system": [], "uri": []}
+        self.suffix = {"system": [], "uri": []}
+        self.delegate = {"public": [], "system": [], "uri": []}
+        self.nextcatalogs = []
+        self.results = {}
+
+        root = ElementTree.parse(path).getroot()
+        if root.tag != "{%s}catalog" % CATALOG_NS:
+            raise XMLCatalogError("%r is not an XML catalog" % path)
+        self._parse(root, urljoin(path, root.get(XMLBASE, "")),
+                    root.get("prefer", "public"))
+
+    def __repr__(self):
+        return "<%s %r>" % (type(self).__name__, self.path)
+
+    def _parse(self, parent, base, prefer):
+        """Parse all entries below parent (catalog or group)"""
+        for node in parent:
+            namespace, _, tag = node.tag[1:].partition("}")
+            if namespace != CATALOG_NS:
+                continue
+            nodebase = urljoin(base, node.get(XMLBASE, ""))
+            if tag == "group":
+                self._parse(node, nodebase, node.get("prefer", prefer))
+            elif tag == "nextCatalog":
+                if node.get("catalog") is not None:
+                    self.nextcatalogs.append(urljoin(nodebase, node.get("catalog")))
+            elif tag in CATALOG_ENTRIES:
+                keyattr, valueattr = CATALOG_ENTRIES[tag]
+                key, value = node.get(keyattr), node.get(valueattr)
+                if key is None or value is None:
+                    log.warning("Incomplete <%s> entry in catalog %r", tag, self.path)
+                    continue
+                self._add(tag, key, urljoin(nodebase, value), prefer)
+
+    def _add(self, tag, key, value, prefer):
+        """Add an entry into the index; the first matching entry wins"""
+        if tag == "public":
+            self.public.setdefault(normalize_publicid(key), value)
+        elif tag == "system":
+            self.system.setdefault(key, value)
+        elif tag == "uri":
+            self.uri.setdefault(key, value)
+        elif tag.startswith("rewrite"):
+            self.rewrite[tag[7:].lower()].append(CatalogMatch(key, value, prefer))
+        elif tag.endswith("Suffix"):
+            self.suffix[tag[:-6].lower()].append(CatalogMatch(key, value, prefer))
+        elif tag == "delegatePublic":
+            key = normalize_publicid(key)
+            self.delegate["public"].append(CatalogMatch(key, value, prefer))
+        else:
+            self.delegate[tag[8:].lower()].append(CatalogMatch(key, value, prefer))
+
+    def _match(self, kind, identifier, depth):
+        """Search identifier only in this catalog and its delegates
+
+        :param str kind: one of "public", "system", or "uri"
+        :param str identifier: the (normalized) identifier
+        :param int depth: current depth of the catalog chain
+        :return: the resolved URL, None (not found), or BREAK
+        """
+        exact = getattr(self, kind)
+        if identifier in exact:
+            return exact[identifier]
+
+        if kind != "public":
+            # The longest matching prefix or suffix wins
+            best = None
+            for entry in self.rewrite[kind]:
+                if identifier.startswith(entry.match) and (
+                        best is None or len(entry.match) > len(best.match)):
+                    best = entry
+            if best is not None:
+                return best.value + identifier[len(best.match):]
+
+            best = None
+            for entry in self.suffix[kind]:
+                if identifier.endswith(entry.match) and (
+                        best is None or len(entry.match) > len(best.match)):
+                    best = entry
+            if best is not None:
+                return best.value
+
+        delegates = []
+        for entry in self.delegate[kind]:
+            if kind == "public" and entry.prefer != "public":
+                continue
+            if identifier.startswith(entry.match) and entry.value not in delegates:
+                delegates.append(entry.value)
+        if not delegates:
+            return None
+
+        for url in delegates:
+            catalog = load_catalog(url)
+            if catalog is None:
+                continue
+            result = catalog.resolve(kind, identifier, depth + 1, nextcatalogs=False)
+            if result not in (None, BREAK):
+                return result
+        # A delegation that didn't succeed stops the search
+        return BREAK
+
+    def resolve(self, kind, identifier, depth=0, nextcatalogs=True):
+        """Resolve identifier in this catalog and its nextCatalog chain
+
+        :param str kind: one of "public", "system", or "uri"
+        :param str identifier: the identifier to look for
+        :param int depth: current depth of the catalog chain
+        :param bool nextcatalogs: also search nextCatalog entries
+        :return: the resolved URL, None (not found), or BREAK
+        """
+        if depth > MAX_CATALOG_DEPTH:
+            log.warning("Catalog chain too deep, stopped at %r", self.path)
+            return None
+
+        if kind == "public":
+            identifier = normalize_publicid(identifier)
+        elif kind == "system" and identifier.startswith(PUBLICID_URN):
+            kind, identifier = "public", normalize_publicid(identifier)
+
+        result = self._match(kind, identifier, depth)
+        if result is not None or not nextcatalogs:
+            return result
+
+        for url in self.nextcatalogs:
+            catalog = load_catalog(url)
+            if catalog is None:
+                continue
+            result = catalog.resolve(kind, identifier, depth + 1)
+            if result is not None:
+                return result
+        return None
+
+    def lookup(self, identifier):
+        """Look up an identifier the same way as ``xmlcatalog CATALOG ID``
+
+        Identifiers which aren't valid URIs are treated as public IDs,
+        all others are looked up as system IDs first and as URIs next.
+        Results are cached for the lifetime of the catalog.
+
+        :param str identifier: the public ID, system ID, or URI
+        :return: the resolved URL or None
+        """
+        if identifier in self.results:
+            return self.results[identifier]
+
+        if r_NOURI.search(identifier):
+            result = self.resolve("public", identifier)
+        else:
+            result = self.resolve("system", identifier)
+            if result in (None, BREAK):
+                result = self.resolve("uri", identifier)
+        if result is BREAK:
+            result = None
+
+        self.results[identifier] = result
+        return result
+
+
+#: All catalogs loaded so far, key is the path of the catalog file
+CATALOGS = {}
+
+
+def load_catalog(url, raise_on_error=False):
+    """Load a catalog file once and return the shared XMLCatalog object
+
+    :param str url: path or file: URL of the catalog
+    :param raise_on_error: flag to raise an exception if the catalog
+       couldn't be loaded (=True) or return None (=False)
+    :return: the catalog or None
+    :rtype: :class:`XMLCatalog`
+    """
+    path = catalogpath(url)
+    if path is None:
+        log.warning("Catalog %r is not a local file, ignored", url)
+        return None
+
+    path = os.path.abspath(path)
+    if path in CATALOGS:
+        return CATALOGS[path]
+
+    try:
+        log.debug("Loading catalog %r", path)
+        catalog = XMLCatalog(path)
+    except (OSError, ElementTree.ParseError, XMLCatalogError) as error:
+        if raise_on_error:
+            raise XMLCatalogError("Cannot load catalog %r: %s" % (url, error))
+        log.warning("Cannot load catalog %r: %s", url, error)
+        return None
+
+    CATALOGS[path] = catalog
+    return catalog
+
+
 # class MyEntityResolver(xmlsh.EntityResolver):
 #    def __init__(self, *args, **kwargs):
 #        super().__init__(*args, **kwargs)
@@ -133,15 +452,159 @@ class XMLCatalogError(LookupError):
 #        log.debug("Trying to resolve publicid=%r, systemid=%r", publicId, systemId)
 
 
-def xmlsyntaxcheck(xmlfile):
+def catalogcachedir():
+    """Return the directory of the shared catalog cache
+
+    The directory is shared with ``xml_cat_resolver``.
+
+    :return: the path to the cache directory
+    :rtype: str
+    """
+    cachehome = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cachehome, "daps", "catalogs")
+
+
+def catalogstamp(catalogs):
+    """Create a stamp of all catalog files reachable from catalogs
+
+    Every catalog file is listed with its path, modification time, and
+    size in breadth-first order. Referenced catalogs are found by
+    scanning for ``catalog`` attributes (``nextCatalog`` and
+    ``delegate*``) without parsing the XML. ``xml_cat_resolver``
+    creates the same stamp, so both share their cache files.
+
+    :param list catalogs: the top-level catalog files
+    :return: the stamp, one line per catalog file
+    :rtype: str
+    """
+    lines = []
+    seen = set()
+    queue = [
+        path if os.path.isabs(path) else os.getcwd() + "/" + path
+        for path in (catalogpath(url) for url in catalogs)
+        if path
+    ]
+    for path in queue:
+        if path in seen:
+            continue
+        seen.add(path)
+        try:
+            stat = os.stat(path)
+            with open(path, "r", encoding="UTF-8", errors="replace") as fh:
+                content = fh.read()
+        except OSError:
+            lines.append("%s - -" % path)
+            continue
+        lines.append("%s %d %d" % (path, stat.st_mtime, stat.st_size))
+        for match in r_CATALOGREF.finditer(content):
+            ref = catalogpath(match.group(1)[1:-1])
+            if ref is None:
+                continue
+            if not ref.startswith("/"):
+                ref = os.path.dirname(path) + "/" + ref
+            queue.append(ref)
+    return "".join(line + "\n" for line in lines)
+
+
+class CatalogCache:
+    """Persistent cache of resolved identifiers for a catalog chain
+
+    The cache file is named after the MD5 sum of the
+    :func:`catalogstamp` of the catalog chain. When a catalog file
+    changes, the stamp changes too and a new (empty) cache file is used.
+    Each line of a cache file contains the identifier and the resolved
+    URL, separated by a TAB. Local paths are stored as ``file://`` URLs,
+    like ``xmlcatalog`` prints them, as ``xml_cat_resolver`` passes the
+    cached URLs on unchanged.
+    """
+
+    def __init__(self, catalogs, cachedir=None):
+        self.catalogs = list(catalogs)
+        self.cachedir = cachedir or catalogcachedir()
+        stamp = catalogstamp(self.catalogs)
+        self.key = hashlib.md5(stamp.encode("UTF-8")).hexdigest()
+        self.path = os.path.join(self.cachedir, self.key)
+        self.entries = {}
+        try:
+            with open(self.path, "r", encoding="UTF-8") as fh:
+                for line in fh:
+                    uri, sep, result = line.rstrip("\n").partition("\t")
+                    if sep and result.startswith("/"):
+                        result = "file://" + result
+                    if sep and result:
+                        self.entries[uri] = result
+        except OSError:
+            pass
+        log.debug("Using catalog cache %r with %d entries",
+                  self.path, len(self.entries))
+
+    def get(self, uri):
+        """Return the cached URL for uri or None"""
+        return self.entries.get(uri)
+
+    def set(self, uri, result):
+        """Store the resolved URL for uri in memory and on disk"""
+        if not result or uri in self.entries or "\t" in uri or "\n" in uri:
+            return
+        if result.startswith("/"):
+            result = "file://" + result
+        self.entries[uri] = result
+        try:
+            os.makedirs(self.cachedir, exist_ok=True)
+            with open(self.path, "a", encoding="UTF-8") as fh:
+                fh.write("%s\t%s\n" % (uri, result))
+        except OSError as error:
+            log.debug("Cannot write catalog cache %r: %s", self.path, error)
+
+
+#: All catalog caches, key is the path of the top-level catalog
+CATALOGCACHES = {}
+
+
+def catalogcache(args):
+    """Return the shared catalog cache for args.catalog or None
+
+    :param args: parsed arguments from CLI parser
+    :return: the catalog cache or None if caching is disabled
+    :rtype: :class:`CatalogCache`
+    """
+    if not args.cache or os.environ.get(CACHE_ENV) == "0" or not args.catalog:
+        return None
+    if args.catalog not in CATALOGCACHES:
+        CATALOGCACHES[args.catalog] = CatalogCache([args.catalog])
+    return CATALOGCACHES[args.catalog]
+
+
+class EndOfProlog(Exception):
+    """Raised by :class:`PrologHandler` when the prolog is parsed"""
+
+
+class PrologHandler(xmlsh.ContentHandler):
+    """Content handler which stops the parser at the root element
+
+    When the start tag of the root element is reported, the prolog
+    (XML declaration, DOCTYPE with its internal subset) is completely
+    parsed.
+    """
+
+    def startElement(self, name, attrs):
+        raise EndOfProlog(name)
+
+
+def xmlsyntaxcheck(xmlfile, prolog_only=False):
     """Check if the XML file is well-formed
 
     :param str xmlfile: XML filename
+    :param bool prolog_only: parse only up to the end of the DOCTYPE
+       declaration (True) or the whole file (False)
     :return: Nothing if the XML is well-formed, otherwise it raises
        an exception
     :raises: :class:`xml.sax.SAXParseException`
     """
-    log.debug("Try XML parser for XML well-formedness...")
+    log.debug("Try XML parser for XML well-formedness%s...",
+              " of the prolog" if prolog_only else "")
     parser = make_parser()
 
     # Set several features of the XML parser
@@ -153,12 +616,19 @@ def xmlsyntaxcheck(xmlfile):
     for feature, state in featureset:
         parser.setFeature(feature, state)
 
-    parser.setContentHandler(xmlsh.ContentHandler())
+    # In prolog only mode, the parser stops when the root element starts.
+    # The file is read in chunks, so the rest of the file is never read.
+    handler = PrologHandler() if prolog_only else xmlsh.ContentHandler()
+    parser.setContentHandler(handler)
     # parser.setEntityResolver(MyEntityResolver())
 
     # This will fail with a SAXParseException when we have a XML file
     # with syntax errors:
-    parser.parse(xmlfile)
+    try:
+        parser.parse(xmlfile)
+    except EndOfProlog as root:
+        log.debug("Prolog of %r is well-formed (root element %r)",
+                  xmlfile, str(root))
     log.debug("XML syntax check ok")
 
 
@@ -170,6 +640,9 @@ def joinEnts(ents, sep):
 def remove_xml_comments(content):
     """Remove all XML comments (<!-- ... -->) in a string
 
+    The content is scanned once from left to right, so the runtime is
+    linear to the length of the content.
+
     :param str content: the content with possible XML comments
     :return: a string without any XML comments
     :rtype: str
@@ -187,29 +660,32 @@ def remove_xml_comments(content):
     -->Hello''')
     'Hello'
     """
+    parts = []
+    pos = 0
     while True:
-        if "<!--" not in content:
-            return content
-        start = COMMENTOPEN.search(content).start()
-        match = COMMENTCLOSE.search(content)
-        if not match:
+        start = content.find("<!--", pos)
+        if start == -1:
+            parts.append(content[pos:])
+            return "".join(parts)
+        end = content.find("-->", start + 4)
+        if end == -1:
             raise ValueError("ERROR: Missing '-->' in comment!")
-        end = match.end()
-        # Extract the comment
-        comment = content[start:end][4:-3]
-        if "--" in comment:
+        if content.find("--", start + 4, end) != -1:
             raise ValueError("ERROR: '--' not allowed in comment")
 
-        # Remove the comment
-        content = content[0:start] + content[end:]
+        # Keep everything between the previous and the current comment
+        parts.append(content[pos:start])
+        pos = end + 3
 
 
-def investigate_identifiers(content, args, base=""):
-    """Investigate some content string for identifiers
+def resolve_identifiers(content, args, base=""):
+    """Resolve all external parameter entities in some content string
 
-    :param str content: string of internal subset
+    :param str content: string of internal subset or entity file
     :param args: parsed arguments from CLI parser
-    :yield:
+    :param str base: directory to resolve local system IDs against
+    :yield: tuple of (path, origin, identifier); path is None if
+       the identifier couldn't be resolved
     """
     for entity in r_ENTITY.finditer(content):
         publicid = entity.group("pubid")
@@ -232,17 +708,28 @@ def investigate_identifiers(content, args, base=""):
             continue
         elif publicid is not None:
             log.debug("Investigate public ID %r...", publicid)
-            result = xmlcatalog(publicid, args.catalog)
-            # check entity
+            result = xmlcatalog(publicid, args.catalog, cache=catalogcache(args))
+            yield result, ORIGIN_PUBLIC, publicid
         elif systemid.startswith("http"):
             log.debug("Investigate system <ID> %r...", systemid)
-            result = xmlcatalog(systemid, args.catalog)
+            result = xmlcatalog(systemid, args.catalog, cache=catalogcache(args))
             log.debug("%s -> %s", systemid, result)
+            yield result, ORIGIN_CATALOG, systemid
         else:
             log.debug("Investigate local path %r...", systemid)
             result = os.path.join(base, systemid)
             log.debug("%s -> %s", systemid, result)
+            yield result, ORIGIN_LOCAL, systemid
+
 
+def investigate_identifiers(content, args, base=""):
+    """Investigate some content string for identifiers
+
+    :param str content: string of internal subset
+    :param args: parsed arguments from CLI parser
+    :yield: the resolved filename or None
+    """
+    for result, _, _ in resolve_identifiers(content, args, base):
         yield result
 
 
@@ -261,13 +748,17 @@ def parse_ent_file(entityfile, args):
     yield from investigate_identifiers(content, args, base)
 
 
-def xmlcatalog(uri, catalog=MAINCATALOG, raise_on_error=False):
-    """Call xmlcatalog and parse return
+def xmlcatalog(uri, catalog=MAINCATALOG, raise_on_error=False, cache=None):
+    """Resolve a URI through the catalog, like ``xmlcatalog CATALOG URI``
+
+    The catalog tree is loaded once and all lookups are answered
+    in-process (see :class:`XMLCatalog`).
 
     :param uri: the URI to query for
     :param catalog: the catalog file to use
     :param raise_on_error: flag to raise an exception if URL couldn't be found (=True)
        or return None (=False)
+    :param cache: the :class:`CatalogCache` for catalog or None
     :return: the resolved string or None
     """
     result = None
@@ -275,13 +766,18 @@ def xmlcatalog(uri, catalog=MAINCATALOG, raise_on_error=False):
         raise XMLCatalogError("Cannot find catalog %r" % catalog)
 
     log.debug("Trying to find %r in catalog %r", uri, catalog)
-    proc = subprocess.run(["xmlcatalog", catalog, uri], stdout=subprocess.PIPE)
-    log.debug("subprocess of 'xmlcatalog': %s", proc)
-    result = proc.stdout.decode("UTF-8")
-    if proc.returncode:
+    if cache is not None:
+        result = cache.get(uri)
+    if result is None:
+        xmlcat = load_catalog(catalog or MAINCATALOG, raise_on_error)
+        if xmlcat is not None:
+            result = xmlcat.lookup(uri)
+        if cache is not None:
+            cache.set(uri, result)
+    if result is None:
         log.warning("URI %r not found in catalog %r", uri, catalog)
         if raise_on_error:
-            raise XMLCatalogError("Problem with xmlcatalog: %s" % result)
+            raise XMLCatalogError("Cannot resolve %r with catalog %r" % (uri, catalog))
         return None
 
     result = result.split("file://")[-1].strip()
@@ -290,77 +786,366 @@ def xmlcatalog(uri, catalog=MAINCATALOG, raise_on_error=False):
     return result
 
 
-def preparelines(xmlfile, linenr, showlines=5):
-    """Read lines from xmlfile but output only the first 6 lines by default.
+def buffer_reader(buffer):
+    """Return a read() function for a buffer which doesn't have one
 
-    :param xmlfile: path to the XML filename
-    :param int linenr: number of lines that should be investigated
-    :param int showlines: show lines (couting from zero to showlines)
-    :return: list of lines
+    :param buffer: any object which supports the buffer protocol
+       (bytes, bytearray, memoryview, ...)
+    :return: function which returns the next ``size`` bytes
     """
-    lines = []
-    with open(xmlfile, "r") as fh:
-        for i in range(linenr):
-            lines.append(fh.readline())
+    view = memoryview(buffer)
+    pos = 0
+
+    def read(size):
+        nonlocal pos
+        block = view[pos:pos + size]
+        pos += len(block)
+        return bytes(block)
+
+    return read
+
+
+def read_prolog(source, blocksize=BLOCKSIZE):
+    """Read the prolog of an XML document up to the end of the DOCTYPE
 
-    if len(lines) > showlines:
-        log.debug("First six lines of file %r:", xmlfile)
-        for i in range(6):
-            log.debug("  line %d: %s", i + 1, lines[i].strip())
-    lines = "".join(lines)
-    return lines
+    The source is read in blocks until the closing ``]>`` (or ``>``) of
+    the DOCTYPE declaration is found. Quoted strings, comments, and
+    processing instructions inside the internal subset are skipped, so a
+    ``]>`` inside them doesn't end the DOCTYPE. If the root element
+    starts before any DOCTYPE, reading stops there.
 
+    :param source: a binary file object, a :class:`mmap.mmap`, or any
+       other buffer (bytes, bytearray, ...)
+    :param int blocksize: number of bytes read at once
+    :return: the decoded prolog; if the end of the DOCTYPE couldn't be
+       found, everything which was read
+    :rtype: str
+    """
+    read = source.read if hasattr(source, "read") else buffer_reader(source)
+    data = bytearray()
+    eof = False
+
+    def fill():
+        """Read the next block, return False at the end of the input"""
+        nonlocal eof
+        if not eof:
+            block = read(blocksize)
+            data.extend(block)
+            eof = not block
+        return not eof
+
+    def peek(pos, size=1):
+        """Return size bytes at pos, reading more blocks as needed"""
+        while len(data) < pos + size and fill():
+            pass
+        return bytes(data[pos:pos + size])
+
+    def skip(token, pos):
+        """Return the position after the next token, -1 if not found"""
+        while True:
+            found = data.find(token, pos)
+            if found != -1:
+                return found + len(token)
+            pos = max(pos, len(data) - len(token) + 1)
+            if not fill():
+                return -1
+
+    def search(regex, pos, overlap):
+        """Return the next match of the regex, None if not found"""
+        while True:
+            match = regex.search(data, pos)
+            if match is not None:
+                return match
+            pos = max(pos, len(data) - overlap)
+            if not fill():
+                return None
+
+    def doctype_end(pos):
+        """Return the position after the DOCTYPE declaration, -1 if none"""
+        # Name and external ID
+        while pos < len(data) or fill():
+            char = data[pos:pos + 1]
+            if char in (b"'", b'"'):
+                pos = skip(char, pos + 1)
+                if pos == -1:
+                    return -1
+            elif char == b">":
+                return pos + 1
+            elif char == b"[":
+                pos += 1
+                break
+            else:
+                pos += 1
+        else:
+            return -1
+
+        # Internal subset
+        while True:
+            match = search(r_SUBSETMARKUP, pos, SUBSETMARKUP_OVERLAP)
+            if match is None:
+                return -1
+            token = match.group()
+            pos = match.end()
+            if token == b"]":
+                while peek(pos) in (b" ", b"\t", b"\r", b"\n"):
+                    pos += 1
+                if peek(pos) == b">":
+                    return pos + 1
+                continue
+            pos = skip({b"<!--": b"-->", b"<?": b"?>"}.get(token, token), pos)
+            if pos == -1:
+                return -1
+
+    # XML declaration, comments, and processing instructions before the
+    # DOCTYPE or the root element
+    end = -1
+    pos = skip(b"<", 0)
+    while pos != -1:
+        if peek(pos) == b"?":
+            pos = skip(b"?>", pos)
+        elif peek(pos, 3) == b"!--":
+            pos = skip(b"-->", pos + 3)
+        elif peek(pos, 8) == b"!DOCTYPE":
+            end = doctype_end(pos + 8)
+            break
+        else:
+            # Root element, there is no DOCTYPE
+            end = pos - 1
+            break
+        if pos != -1:
+            pos = skip(b"<", pos)
+
+    if end != -1:
+        del data[end:]
 
-def getentities(args, linenr=50):
-    """Read first 50 lines (default) and return any parameter entity names
+    match = r_XMLENCODING.match(data)
+    encoding = match.group(1).decode("ascii") if match else "utf-8-sig"
+    try:
+        return data.decode(encoding, errors="replace")
+    except LookupError:
+        return data.decode("utf-8-sig", errors="replace")
+
+
+class EntityGraph:
+    """Dependency graph of XML files and their external parameter entities
+
+    Nodes are keyed by the real path of a file, so a file which is
+    reachable through different paths (symbolic links, "../") is
+    visited only once. Each node is an :class:`EntityNode` with the path
+    as it was found first, its origin (one of the ``ORIGIN_*``
+    constants), and the public or system identifier.
+    Edges point from a file to the entity files it references, in
+    document order.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+
+    def __contains__(self, path):
+        return os.path.realpath(path) in self.nodes
+
+    def add_node(self, path, origin, identifier=None):
+        """Add a file (if it isn't already known) and return its key"""
+        key = os.path.realpath(path)
+        if key not in self.nodes:
+            self.nodes[key] = EntityNode(path, origin, identifier)
+            self.edges[key] = []
+        return key
+
+    def add_edge(self, source, target):
+        """Add a reference from the source key to the target key"""
+        if target not in self.edges[source]:
+            self.edges[source].append(target)
+
+    def entities(self):
+        """Return the keys of all entity files in breadth-first order"""
+        return [key for key, node in self.nodes.items()
+                if node.origin != ORIGIN_XML]
+
+    def dependencies(self, path):
+        """Return the keys of all entity files reachable from path
+
+        :param str path: path of a file in the graph
+        :return: list of keys in breadth-first order
+        """
+        start = os.path.realpath(path)
+        result = []
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            for target in self.edges.get(queue.popleft(), []):
+                if target not in seen:
+                    seen.add(target)
+                    result.append(target)
+                    queue.append(target)
+        return result
+
+
+def internal_subset(xmlfile):
+    """Return the internal subset of the DTD from the prolog
+
+    :param str xmlfile: path to the XML filename
+    :return: the internal subset without comments or None
+    """
+    with open(xmlfile, "rb") as fh:
+        lines = read_prolog(fh)
+
+    # Try to find matches
+    match = r_DOCTYPE.search(lines)
+    if not match:
+        return None
+    log.debug("Match: %r", match.string)
+    log.debug("DOCTYPE and internal subset: %s", match.groupdict())
+    internalsubset = match.group("IntSubset")
+    if internalsubset is None:
+        log.debug("No internal subset found in %r", xmlfile)
+        return None
+    return remove_xml_comments(internalsubset)
+
+
+def add_references(graph, queue, source, content, args, base):
+    """Add all entity files referenced in content to the graph
+
+    New entity files are appended to the queue.
+    """
+    for path, origin, identifier in resolve_identifiers(content, args, base):
+        if path is None:
+            continue
+        known = path in graph
+        target = graph.add_node(path, origin, identifier)
+        graph.add_edge(source, target)
+        if not known:
+            log.debug("Found entity %r", path)
+            queue.append(target)
+
+
+def build_entity_graph(args, errors=None):
+    """Build the entity dependency graph of all XML files
+
+    Each XML file is checked for well-formedness and its internal subset
+    is searched for external parameter entities. All reachable entity
+    files are visited once in breadth-first order, regardless how deep
+    they are nested.
 
     :param args: parsed arguments from CLI parser
-    :param int linenr: number of lines that should be investigated
-    :return: a list of all found entities
+    :param dict errors: if given, XML and entity files which are not
+       well-formed or can't be read are skipped and their exception is
+       stored here (path as key); otherwise the exception is raised
+    :return: the entity graph
+    :rtype: :class:`EntityGraph`
     """
-    # Holds a dictionary of (relative) paths as keys and absolut paths as values:
-    ents = {}
-    seen = set()
+    graph = EntityGraph()
+    queue = deque()
 
     for xmlfile in args.xmlfiles:
         # Checks for well-formed XML
         # does nothing if XML is well-formed, otherwise raises a SAXParseException
-        xmlsyntaxcheck(xmlfile)
-
-        # Prepare the first N lines (linenr)
-        lines = preparelines(xmlfile, linenr)
-
-        # Try to find matches
-        match = r_DOCTYPE.search(lines)
-        if match:
-            log.debug("Match: %r", match.string)
-            log.debug("DOCTYPE and internal subset: %s", match.groupdict())
-            internalsubset = match.group("IntSubset")
-            if internalsubset is None:
-                log.debug("No internal subset found in %r", xmlfile)
-                # No internal subset, so continue with next file
+        try:
+            xmlsyntaxcheck(xmlfile, prolog_only=not args.full_check)
+            content = internal_subset(xmlfile)
+        except (SAXParseException, OSError, ValueError) as error:
+            if errors is None:
+                raise
+            errors[xmlfile] = error
+            continue
+        source = graph.add_node(xmlfile, ORIGIN_XML)
+
+        if content is None:
+            # No internal subset, so continue with next file
+            continue
+        log.debug("Looking for entities...")
+        add_references(graph, queue, source, content, args,
+                       os.path.dirname(xmlfile))
+
+    # Process all entity files to find other referenced PEs
+    while queue:
+        source = queue.popleft()
+        entityfile = graph.nodes[source].path
+        log.debug("Investigate entity file %r...", entityfile)
+        try:
+            with open(entityfile, "r") as fh:
+                content = remove_xml_comments(fh.read())
+        except (OSError, ValueError) as error:
+            if errors is None:
+                raise
+            errors[entityfile] = error
+            continue
+        add_references(graph, queue, source, content, args,
+                       os.path.dirname(entityfile))
+
+    return graph
+
+
+def getentities(args):
+    """Read the prolog and return any parameter entity names
+
+    :param args: parsed arguments from CLI parser
+    :return: a dictionary of all found entities (path as key and value)
+    """
+    graph = build_entity_graph(args)
+    paths = [graph.nodes[key].path for key in graph.entities()]
+    return dict(zip(paths, paths))
+
+
+def write_make_deps(graph, filename):
+    """Write the entity files of each XML file as make variables
+
+    For every XML file, a line ``ENTITIES_DEPS_<xmlfile> := <entities>``
+    is written.
+
+    :param graph: the entity graph
+    :type graph: :class:`EntityGraph`
+    :param str filename: the file to write to
+    """
+    with open(filename, "w") as fh:
+        for key, node in graph.nodes.items():
+            if node.origin != ORIGIN_XML:
                 continue
+            deps = [graph.nodes[dep].path for dep in graph.dependencies(key)]
+            fh.write("ENTITIES_DEPS_%s := %s\n" % (node.path, " ".join(deps)))
 
-            content = remove_xml_comments(internalsubset)
-            base = os.path.dirname(xmlfile)
 
-            log.debug("Looking for entities...")
-            for entity in investigate_identifiers(content, args, base):
-                # log.debug("Got %r as file", entity)
-                if (entity is None) or entity in seen:
-                    continue
-                seen.add(entity)
-                ents[entity] = entity
-                log.debug("Found entity %r %s", entity, ents)
+def write_json_lines(graph, xmlfiles, errors, stream=None):
+    """Write one JSON object per XML file with its entity files
+
+    Each line contains either ``{"file": ..., "entities": [...]}`` or,
+    if the XML file or one of its entity files couldn't be investigated,
+    ``{"file": ..., "error": ...}``.
+
+    :param graph: the entity graph
+    :type graph: :class:`EntityGraph`
+    :param list xmlfiles: the XML files in the order of the output
+    :param dict errors: XML and entity files with their exception
+    :param stream: the file object to write to (default: stdout)
+    """
+    stream = sys.stdout if stream is None else stream
+    for xmlfile in xmlfiles:
+        if xmlfile in errors:
+            result = {"file": xmlfile, "error": str(errors[xmlfile])}
+            stream.write(json.dumps(result) + "\n")
+            continue
+        paths = [graph.nodes[dep].path for dep in graph.dependencies(xmlfile)]
+        failed = [path for path in paths if path in errors]
+        if failed:
+            result = {"file": xmlfile, "error": str(errors[failed[0]])}
+        else:
+            result = {"file": xmlfile, "entities": paths}
+        stream.write(json.dumps(result) + "\n")
+
 
-    resultdict = ents.copy()
-    # Process ents to find other referenced PEs
-    for absolute in ents.values():
-        for entity in parse_ent_file(absolute, args):
-            if entity not in seen:
-                seen.add(entity)
-                resultdict[entity] = os.path.join(os.path.dirname(absolute), entity)
-    return resultdict
+def readmanifest(manifest):
+    """Read XML filenames from a manifest file, one per line
+
+    Empty lines and lines starting with "#" are ignored.
+
+    :param str manifest: the manifest file or "-" for stdin
+    :return: list of filenames
+    """
+    fh = sys.stdin if manifest == "-" else open(manifest, "r")
+    with fh:
+        lines = [line.strip() for line in fh]
+    return [line for line in lines if line and not line.startswith("#")]
 
 
 def parsecli(cliargs=None):
@@ -370,9 +1155,6 @@ def parsecli(cliargs=None):
     :return: parsed CLI result
     :rtype: :class:`argparse.Namespace`
     """
-    # Setup logging
-    dictConfig(DEFAULT_LOGGING_DICT)
-
     parser = argparse.ArgumentParser(
         description=__doc__.strip(),
         formatter_class=argparse.RawDescriptionHelpFormatter,  # noqa: E501
@@ -391,7 +1173,7 @@ def parsecli(cliargs=None):
         "--absolute",
         default=False,
         action="store_true",
-        help="Make paths absolute (default: %(default)s)",
+        help="Deprecated and ignored; the paths are always absolute",
     )
     parser.add_argument(
         "-P",
@@ -419,10 +1201,62 @@ def parsecli(cliargs=None):
         help="Use the catalog to query the input",
     )
     parser.add_argument(
-        "xmlfiles", metavar="XMLFILES", nargs="+", help="One or more XML files"
+        "--no-cache",
+        dest="cache",
+        default=True,
+        action="store_false",
+        help=(
+            "Don't use the persistent catalog cache in "
+            "$XDG_CACHE_HOME/daps/catalogs (default: use it)"
+        ),
+    )
+    parser.add_argument(
+        "-F",
+        "--full-check",
+        default=False,
+        action="store_true",
+        help=(
+            "Check the whole XML file for well-formedness, not only "
+            "the prolog up to the end of the DOCTYPE (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "-M",
+        "--make-deps",
+        metavar="FILE",
+        help=(
+            "Write the entity files of each XML file as make "
+            "variables ENTITIES_DEPS_<xmlfile> into FILE"
+        ),
+    )
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        metavar="FILE",
+        help=(
+            "Read additional XML files from FILE, one per line; "
+            "use '-' for stdin"
+        ),
+    )
+    parser.add_argument(
+        "--json",
+        default=False,
+        action="store_true",
+        help=(
+            "Output one JSON object with the entity files per XML file "
+            "(JSON lines). XML files with errors are reported, but don't "
+            "stop the processing (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "xmlfiles", metavar="XMLFILES", nargs="*", help="One or more XML files"
     )
 
     args = parser.parse_args(cliargs)
+
+    # Setup logging; not earlier, --help and --version don't need it
+    from logging.config import dictConfig
+    dictConfig(DEFAULT_LOGGING_DICT)
     level = LOGLEVELS.get(args.verbose, logging.DEBUG)
     # log.setLevel(LOGLEVELS.get(args.verbose, logging.DEBUG))
     log.setLevel(level)
@@ -430,6 +1264,9 @@ def parsecli(cliargs=None):
     log.debug("")
     # Save our parser instance:
     args.parser = parser
+    if args.absolute:
+        log.warning("--absolute is deprecated and ignored, "
+                    "the paths are always absolute")
 
     # Fix separators
     if args.separator == "\\n":
@@ -437,6 +1274,11 @@ def parsecli(cliargs=None):
     elif args.separator == "\\t":
         args.separator = "\t"
 
+    if args.manifest:
+        args.xmlfiles.extend(readmanifest(args.manifest))
+    if not args.xmlfiles:
+        parser.error("Need at least one XML file")
+
     resultargs = []
     for fn in args.xmlfiles:
         if not os.path.exists(fn):
@@ -464,14 +1306,19 @@ def main(cliargs=None):
             args.parser.print_usage()
             sys.exit(1)
 
-        ents = getentities(args)
-        if args.absolute:
-            print(joinEnts(ents.values(), args.separator))
-        else:
-            print(joinEnts(ents, args.separator))
+        errors = {} if args.json else None
+        graph = build_entity_graph(args, errors)
+        if args.make_deps:
+            write_make_deps(graph, args.make_deps)
+        if args.json:
+            write_json_lines(graph, args.xmlfiles, errors)
+            return 1 if errors else 0
+        ents = [graph.nodes[key].path for key in graph.entities()]
+        print(joinEnts(ents, args.separator))
         return 0
 
-    except (FileNotFoundError, IOError, SAXParseException, XMLCatalogError) as error:
+    except (FileNotFoundError, IOError, ValueError, SAXParseException,
+            XMLCatalogError) as error:
         log.fatal(error)
     return 1
 
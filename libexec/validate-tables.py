@@ -15,18 +15,112 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import argparse
+import copy
+import hashlib
+import json
+import os
+import re
 import sys
+import tempfile
 import traceback
+from urllib.parse import urljoin
 from lxml import etree
 
 docbook_nsmap = {'d': 'http://docbook.org/ns/docbook'}
+table_xpath = ('//table|//informaltable|//entrytbl|'
+    '//d:table|//d:informaltable|//d:entrytbl')
+subtable_xpath = ('descendant-or-self::*[self::table or self::informaltable '
+    'or self::entrytbl or self::d:table or self::d:informaltable '
+    'or self::d:entrytbl]')
+table_tags = frozenset(ns + name
+    for ns in ('', '{%s}' % docbook_nsmap['d'])
+    for name in ('table', 'informaltable', 'entrytbl'))
+xinclude_tags = frozenset(('{http://www.w3.org/2001/XInclude}include',
+    '{http://www.w3.org/2003/XInclude}include'))
+fallback_tags = frozenset(('{http://www.w3.org/2001/XInclude}fallback',
+    '{http://www.w3.org/2003/XInclude}fallback'))
+xml_base = '{http://www.w3.org/XML/1998/namespace}base'
+docbook_prefix = '{%s}' % docbook_nsmap['d']
+
+# Environment variable to disable the result cache (if set to "0")
+cache_env = 'DAPS_TABLE_CACHE'
+# Placeholder for element_info() in cached error messages
+placeholder = re.compile('\x00([0-9]+)\x00')
+
+# Messages of layout errors found by validate_cells()
+layout_messages = {
+    'rowspan-overflow': 'Rowspan overflow',
+    'column-overflow': 'Column overflow on row %d',
+    'holes': 'Holes in row %d',
+    'intersecting-cells': 'Intersecting cells on row %d',
+}
 
 class DocBookError(RuntimeError):
-    """Exception class for DocBook formatting errors"""
+    """
+    Exception class for DocBook formatting errors
+    The single errors are in the issues list, each one a dict with the
+    element, kind, and message of the error; layout errors additionally
+    have block, row, and rendering.
+    """
 
-    def __init__(self, elem, message, *args, **kwargs):
+    def __init__(self, elem, message, *args, issues=None, **kwargs):
         tmp = element_info(elem)
         super().__init__(tmp + ' ' + message, *args, **kwargs)
+        if issues is None:
+            issues = [dict(element=elem, kind='structure', message=message)]
+        self.issues = issues
+
+def local_name(tag):
+    """Local name of DocBook 4 or 5 element, '' for other namespaces."""
+    if tag[0] != '{':
+        name = tag
+    elif tag.startswith(docbook_prefix):
+        name = tag[len(docbook_prefix):]
+    else:
+        name = ''
+    local_names[tag] = name
+    return name
+
+# Cache of local_name() results
+local_names = dict()
+
+class ChildIndex:
+    """
+    Child elements of a node, classified by local name in one pass.
+    Elements without namespace (DocBook 4) and in the DocBook 5 namespace
+    are treated the same, other elements are ignored.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.order = [(local_names.get(child.tag) or local_name(child.tag), child)
+            for child in node.iterchildren(etree.Element)]
+        self.buckets = None
+
+    def select(self, *names):
+        """List children with any of the names in document order."""
+        if len(names) > 1:
+            return [child for name, child in self.order if name in names]
+        if self.buckets is None:
+            self.buckets = dict()
+            for name, child in self.order:
+                if name in self.buckets:
+                    self.buckets[name].append(child)
+                elif name:
+                    self.buckets[name] = [child]
+        return self.buckets.get(names[0], [])
+
+    def optional(self, name):
+        """Find single child or return None. Multiple children result in error."""
+        tmp = self.select(name)
+
+        if len(tmp) > 1:
+            raise DocBookError(self.node,
+                'XPath returned too many results: %s|d:%s' % (name, name))
+        elif len(tmp) > 0:
+            return tmp[0]
+        return None
 
 class CALSTable:
     """
@@ -41,20 +135,19 @@ class CALSTable:
         if node.tag == 'entrytbl':
             self.tgroups.append(parse_tgroup(node))
         else:
-            tgroup_list = node.xpath('tgroup|d:tgroup',
-                namespaces=docbook_nsmap)
-            for item in tgroup_list:
+            for item in ChildIndex(node).select('tgroup'):
                 self.tgroups.append(parse_tgroup(item))
 
     def validate(self):
         err_list = []
+        issues = []
         for colcount, blocks in self.tgroups:
-            tmp = validate_table(blocks, colcount)
+            tmp = validate_table(blocks, colcount, issues)
             if tmp:
                 err_list.append(tmp)
         if err_list:
             raise DocBookError(self.node, 'Errors in table:\n' +
-                '\n'.join(err_list))
+                '\n'.join(err_list), issues=issues)
 
 class HTMLTable:
     """
@@ -63,10 +156,11 @@ class HTMLTable:
 
     def __init__(self, node):
         self.node = node
-        thead = optional_node(node, 'thead|d:thead')
-        tfoot = optional_node(node, 'tfoot|d:tfoot')
-        tbody_list = node.xpath('tbody|d:tbody', namespaces=docbook_nsmap)
-        tr_list = node.xpath('tr|d:tr', namespaces=docbook_nsmap)
+        children = ChildIndex(node)
+        thead = children.optional('thead')
+        tfoot = children.optional('tfoot')
+        tbody_list = children.select('tbody')
+        tr_list = children.select('tr')
 
         if len(tbody_list) > 0 and len(tr_list) > 0:
             raise DocBookError(node, 'HTML table cannot contain both <tbody> and <tr>')
@@ -75,7 +169,7 @@ class HTMLTable:
             raise DocBookError(node, 'HTML table must contain <tbody> or <tr>')
 
         self.blocks = []
-        self.colcount = count_coldefs(node)
+        self.colcount = count_coldefs(children)
 
         if thead is not None:
             self.blocks.append((thead, parse_html_tblock(thead)))
@@ -84,7 +178,7 @@ class HTMLTable:
             self.blocks.append((item, parse_html_tblock(item)))
 
         if len(tr_list) > 0:
-            self.blocks.append((node, parse_html_tblock(node)))
+            self.blocks.append((node, parse_html_tblock(node, children)))
 
         if tfoot is not None:
             self.blocks.append((tfoot, parse_html_tblock(tfoot)))
@@ -95,20 +189,12 @@ class HTMLTable:
                 self.colcount += cspan
 
     def validate(self):
-        msg = validate_table(self.blocks, self.colcount)
+        issues = []
+        msg = validate_table(self.blocks, self.colcount, issues)
 
         if msg:
-            raise DocBookError(self.node, 'Errors in table:\n' + msg)
-
-def optional_node(parent, xpath):
-    """Find single XML node or return NULL. Multiple nodes result in error."""
-    tmp = parent.xpath(xpath, namespaces=docbook_nsmap)
-
-    if len(tmp) > 1:
-        raise DocBookError(parent, 'XPath returned too many results: ' + xpath)
-    elif len(tmp) > 0:
-        return tmp[0]
-    return None
+            raise DocBookError(self.node, 'Errors in table:\n' + msg,
+                issues=issues)
 
 def element_info(elem):
     """Generate element info string: "filename:line: <tag>"."""
@@ -116,7 +202,7 @@ def element_info(elem):
 
 def intattr(node, attrname, default=None, required=True):
     """Get and validate int() value of XML attribute."""
-    value = node.attrib.get(attrname, default)
+    value = node.get(attrname, default)
 
     if value is None:
         if required:
@@ -136,36 +222,39 @@ def parse_tgroup(node):
     if colcount is None or colcount < 1:
         raise DocBookError(node, 'Invalid cols attribute')
 
-    colspec = parse_colspec(node, colcount)
-    spanspec = parse_spanspec(node, colspec)
-    thead = optional_node(node, 'thead|d:thead')
-    tfoot = optional_node(node, 'tfoot|d:tfoot')
-    tbody_list = node.xpath('tbody|d:tbody', namespaces=docbook_nsmap)
+    children = ChildIndex(node)
+    colspec = parse_colspec(children, colcount)
+    spanspec = parse_spanspec(children, colspec)
+    thead = children.optional('thead')
+    tfoot = children.optional('tfoot')
+    tbody_list = children.select('tbody')
 
     if len(tbody_list) != 1:
         raise DocBookError(node, 'Element must contain exactly one <tbody>')
 
     if thead is not None:
-        tmpspec = parse_colspec(thead, colcount)
+        thead_children = ChildIndex(thead)
+        tmpspec = parse_colspec(thead_children, colcount)
         if tmpspec:
-            blocks.append((thead, parse_cals_tblock(thead, tmpspec, dict())))
+            blocks.append((thead, parse_cals_tblock(thead_children, tmpspec, dict())))
         else:
-            blocks.append((thead, parse_cals_tblock(thead, colspec, spanspec)))
+            blocks.append((thead, parse_cals_tblock(thead_children, colspec, spanspec)))
     tbody = tbody_list[0]
-    blocks.append((tbody, parse_cals_tblock(tbody, colspec, spanspec)))
+    blocks.append((tbody, parse_cals_tblock(ChildIndex(tbody), colspec, spanspec)))
     if tfoot is not None:
-        tmpspec = parse_colspec(tfoot, colcount)
+        tfoot_children = ChildIndex(tfoot)
+        tmpspec = parse_colspec(tfoot_children, colcount)
         if tmpspec:
-            blocks.append((tfoot, parse_cals_tblock(tfoot, tmpspec, dict())))
+            blocks.append((tfoot, parse_cals_tblock(tfoot_children, tmpspec, dict())))
         else:
-            blocks.append((tfoot, parse_cals_tblock(tfoot, colspec, spanspec)))
+            blocks.append((tfoot, parse_cals_tblock(tfoot_children, colspec, spanspec)))
 
     return (colcount, blocks)
 
-def parse_colspec(node, colcount):
+def parse_colspec(children, colcount):
     """Parse CALS table <colspec> list"""
     ret = dict()
-    nodelist = node.xpath('colspec|d:colspec', namespaces=docbook_nsmap)
+    nodelist = children.select('colspec')
     checklist = [None] * colcount
     pos = 1
 
@@ -189,10 +278,10 @@ def parse_colspec(node, colcount):
 
     return ret
 
-def parse_spanspec(node, colspec):
+def parse_spanspec(children, colspec):
     """Parse CALS table <spanspec> list"""
     ret = dict()
-    nodelist = node.xpath('spanspec|d:spanspec', namespaces=docbook_nsmap)
+    nodelist = children.select('spanspec')
 
     for item in nodelist:
         name = item.attrib.get('spanname')
@@ -215,27 +304,26 @@ def parse_spanspec(node, colspec):
         ret[name] = (startcol, endcol - startcol + 1)
     return ret
 
-def parse_cals_tblock(node, colspec, spanspec):
+def parse_cals_tblock(children, colspec, spanspec):
     """Parse CALS table <thead>, <tfoot> or <tbody> element"""
     ret = []
-    row_list = node.xpath('row|d:row', namespaces=docbook_nsmap)
+    row_list = children.select('row')
 
     if len(row_list) <= 0:
-        raise DocBookError(node, 'Element contains no <row>')
+        raise DocBookError(children.node, 'Element contains no <row>')
 
     for row in row_list:
-        nodelist = row.xpath('entry|d:entry|entrytbl|d:entrytbl',
-            namespaces=docbook_nsmap)
+        nodelist = ChildIndex(row).select('entry', 'entrytbl')
         col_list = []
 
         if len(nodelist) <= 0:
             raise DocBookError(row, 'Empty row')
 
         for col in nodelist:
-            colname = col.attrib.get('colname')
-            spanname = col.attrib.get('spanname')
-            namest = col.attrib.get('namest')
-            nameend = col.attrib.get('nameend')
+            colname = col.get('colname')
+            spanname = col.get('spanname')
+            namest = col.get('namest')
+            nameend = col.get('nameend')
 
             colnum = None
             rowspan = intattr(col, 'morerows', 0) + 1
@@ -268,19 +356,21 @@ def parse_cals_tblock(node, colspec, spanspec):
         ret.append(col_list)
     return ret
 
-def parse_html_tblock(node):
+def parse_html_tblock(node, children=None):
     """
     Parse HTML table <thead>, <tfoot>, <tbody> element or rows directly
     under <table> or <informaltable>
     """
     ret = []
-    row_list = node.xpath('tr|d:tr', namespaces=docbook_nsmap)
+    if children is None:
+        children = ChildIndex(node)
+    row_list = children.select('tr')
 
     if len(row_list) <= 0:
         raise DocBookError(node, 'Element contains no <tr>')
 
     for row in row_list:
-        nodelist = row.xpath('td|d:td|th|d:th', namespaces=docbook_nsmap)
+        nodelist = ChildIndex(row).select('td', 'th')
         col_list = []
 
         if len(nodelist) <= 0:
@@ -300,78 +390,155 @@ def parse_html_tblock(node):
 
     return ret
 
-def count_coldefs(node):
+def count_coldefs(children):
     """Validate <col>/<colgroup> definitions and calculate column count"""
     ret = None
-    coldef = node.xpath('col|d:col', namespaces=docbook_nsmap)
+    coldef = children.select('col')
 
     if len(coldef) > 0:
         ret = len(coldef)
 
-    coldef = node.xpath('colgroup|d:colgroup', namespaces=docbook_nsmap)
+    coldef = children.select('colgroup')
 
     if len(coldef) <= 0:
         return ret
     if ret is not None:
-        raise DocBookError(node, 'Table cannot contain both <col> and <colgroup>')
+        raise DocBookError(children.node,
+            'Table cannot contain both <col> and <colgroup>')
 
     ret = 0
     for item in coldef:
-        tmp = int(item.xpath('count(col|d:col)', namespaces=docbook_nsmap))
+        tmp = len(ChildIndex(item).select('col'))
         if tmp > 0:
             ret += tmp
         else:
             ret += intattr(item, 'span', 1)
     return ret
 
+# Cell states in CellGrid, and their transition when a cell is added
+EMPTY, SINGLE, MULTIPLE = 0, 1, 2
+occupy_table = bytes([SINGLE] + [MULTIPLE] * 255)
+# Rendering of cell states inside and outside of the table
+render_table = bytes.maketrans(b'\0\1\2', b' oX')
+overflow_table = bytes.maketrans(b'\0\1\2', b' +X')
+
+class CellGrid:
+    """
+    Occupancy grid of a table block, stored row by row in a flat bytearray.
+    Each position is EMPTY, SINGLE, or MULTIPLE (intersecting cells).
+    Every row starts with colcount positions, cells beyond the end of a
+    row are appended to it (column overflow).
+    """
+
+    def __init__(self, rowcount, colcount):
+        # <colgroup span="0"/> gives no columns at all; all cells overflow
+        colcount = max(colcount, 0)
+        self.colcount = colcount
+        self.width = colcount
+        self.cells = bytearray(rowcount * colcount)
+        self.rowlen = [colcount] * rowcount
+
+    def __len__(self):
+        return len(self.rowlen)
+
+    def widen(self, width):
+        """Make room for rows with up to width positions."""
+        cells = bytearray(len(self.rowlen) * width)
+        for rpos in range(len(self.rowlen)):
+            cells[rpos * width:rpos * width + self.width] = \
+                self.cells[rpos * self.width:(rpos + 1) * self.width]
+        self.cells = cells
+        self.width = width
+
+    def row(self, rpos):
+        """Return cell states of a row."""
+        start = rpos * self.width
+        return bytes(self.cells[start:start + self.rowlen[rpos]])
+
+    def first_free(self, rpos, cpos):
+        """Return first EMPTY position in row at or after cpos."""
+        start = rpos * self.width
+        pos = self.cells.find(EMPTY, start + cpos, start + self.rowlen[rpos])
+        return self.rowlen[rpos] if pos == -1 else pos - start
+
+    def occupy(self, rpos, cpos, rspan, cspan):
+        """Add a cell spanning rspan rows and cspan columns."""
+        cells, width = self.cells, self.width
+        if cpos + cspan <= self.colcount and rspan > cspan:
+            # inside of all rows, update column by column
+            for x in range(rpos * width + cpos, rpos * width + cpos + cspan):
+                stop = x + (rspan - 1) * width + 1
+                cells[x:stop:width] = cells[x:stop:width].translate(occupy_table)
+            return
+        for y in range(rpos, rpos + rspan):
+            if cpos + cspan <= self.rowlen[y]:
+                start = y * self.width + cpos
+                self.cells[start:start + cspan] = \
+                    self.cells[start:start + cspan].translate(occupy_table)
+                continue
+            for x in range(cpos, cpos + cspan):
+                if x >= self.rowlen[y]:
+                    x = self.rowlen[y]
+                    self.rowlen[y] += 1
+                    if x >= self.width:
+                        self.widen(max(2 * self.width, 1))
+                pos = y * self.width + x
+                self.cells[pos] = occupy_table[self.cells[pos]]
+
+    def is_valid(self, rowcount):
+        """Check whether the grid has exactly rowcount full rows."""
+        if len(self.rowlen) != rowcount or self.width != self.colcount:
+            return False
+        return self.cells.count(SINGLE) == len(self.cells)
+
 def expand_cells(parent, tblock, colcount):
     """Generate table layout for validation/rendering"""
-    ret = []
-    for row in tblock:
-        ret.append(colcount * [0])
+    rowcount = len(tblock)
     for rpos, row in enumerate(tblock):
+        for startpos, rspan, cspan in row:
+            if rspan > 1:
+                rowcount = max(rowcount, rpos + rspan)
+    ret = CellGrid(rowcount, colcount)
+    cells = ret.cells
+    for rpos, row in enumerate(tblock):
+        start = rpos * ret.width
         cpos = 0
         for startpos, rspan, cspan in row:
             # handle rowspan from preceding rows
-            while cpos < len(ret[rpos]) and ret[rpos][cpos] > 0:
-                cpos += 1
+            if cpos < ret.rowlen[rpos] and cells[start + cpos]:
+                cpos = ret.first_free(rpos, cpos)
             if startpos is not None:
                 if startpos < cpos:
                     raise DocBookError(parent, 'Swapped cells on row %d' %
                         (rpos+1))
                 cpos = startpos
-            for y in range(rspan):
-                if rpos + y >= len(ret):
-                    ret.append(colcount * [0])
-                cell_list = ret[rpos + y]
-                for x in range(cspan):
-                    if cpos + x >= len(cell_list):
-                        cell_list.append(1)
-                    else:
-                        cell_list[cpos + x] += 1
+            if rspan == 1 and cspan == 1 and cpos < ret.rowlen[rpos]:
+                # the common case, a single cell inside of the row
+                cells[start + cpos] = occupy_table[cells[start + cpos]]
+            else:
+                ret.occupy(rpos, cpos, rspan, cspan)
+                # the grid may have been widened
+                cells = ret.cells
+                start = rpos * ret.width
             cpos += cspan
     return ret
 
 def render_cells(row_prefix, cell_block, rowcount, colcount):
     """Render table layout in ASCII art"""
     ret = []
-    for rpos, row in enumerate(cell_block):
+    for rpos in range(len(cell_block)):
+        row = cell_block.row(rpos)
         err = (len(row) != colcount) or rpos >= rowcount
-        err = err or bool([x for x in row if x != 1])
+        err = err or row.count(SINGLE) != len(row)
         tmp = []
         tmp.append('!!' if err else '  ')
         tmp.append(row_prefix if rpos < rowcount else (' ' * len(row_prefix)))
         tmp.append(' ')
-
-        for cpos, item in enumerate(row):
-            if item > 1:
-                tmp.append('X')
-            elif item <= 0:
-                tmp.append(' ')
-            elif cpos >= colcount or rpos >= rowcount:
-                tmp.append('+')
-            else:
-                tmp.append('o')
+        if rpos < rowcount:
+            tmp.append(row[:colcount].translate(render_table).decode())
+            tmp.append(row[colcount:].translate(overflow_table).decode())
+        else:
+            tmp.append(row.translate(overflow_table).decode())
         ret.append(''.join(tmp))
     return '\n'.join(ret)
 
@@ -379,21 +546,34 @@ def validate_cells(cell_block, rowcount, colcount):
     """
     Validate layout of a single table block (<thead>, <tfoot> or <tbody>).
     Check for holes, overflows and intersecting cells.
+    Return list of (kind, row), see layout_messages.
     """
     err_list = []
+    if cell_block.is_valid(rowcount):
+        return err_list
     if len(cell_block) > rowcount:
-        err_list.append('Rowspan overflow')
-    for rpos, row in enumerate(cell_block[:rowcount], start=1):
+        err_list.append(('rowspan-overflow', None))
+    for rpos in range(min(rowcount, len(cell_block))):
+        row = cell_block.row(rpos)
         if len(row) > colcount:
-            err_list.append('Column overflow on row %d' % rpos)
-        if [x for x in row if x < 1]:
-            err_list.append('Holes in row %d' % rpos)
-        if [x for x in row if x > 1]:
-            err_list.append('Intersecting cells on row %d' % rpos)
+            err_list.append(('column-overflow', rpos + 1))
+        if EMPTY in row:
+            err_list.append(('holes', rpos + 1))
+        if MULTIPLE in row:
+            err_list.append(('intersecting-cells', rpos + 1))
     return err_list
 
-def validate_table(blocklist, colcount):
-    """Validate entire HTML table or CALS <tgroup> (from layout)"""
+def layout_message(kind, row):
+    """Return message of layout error."""
+    if row is None:
+        return layout_messages[kind]
+    return layout_messages[kind] % row
+
+def validate_table(blocklist, colcount, issues=None):
+    """
+    Validate entire HTML table or CALS <tgroup> (from layout)
+    Errors are added to the issues list, if given.
+    """
     pmap = dict(thead='H', tfoot='F', tbody='B', table='T', informaltable='T')
     cell_blocks = []
     for parent, rowlist in blocklist:
@@ -401,9 +581,12 @@ def validate_table(blocklist, colcount):
             expand_cells(parent, rowlist, colcount)))
 
     err_list = []
+    found = []
     for parent, rowlist, prefix, block in cell_blocks:
         tmp = validate_cells(block, len(rowlist), colcount)
         if tmp:
+            found.extend((parent, kind, row) for kind, row in tmp)
+            tmp = [layout_message(kind, row) for kind, row in tmp]
             tmp.insert(0, '- ' + element_info(parent))
             err_list.append('\n  - '.join(tmp))
 
@@ -415,13 +598,18 @@ def validate_table(blocklist, colcount):
         block_list.append(render_cells(prefix, block, len(rowlist), colcount))
     sep = '\n    ' + ('-' * colcount) + '\n'
     rendered = sep.join(block_list)
+    if issues is not None:
+        for parent, kind, row in found:
+            issues.append(dict(element=parent, kind=kind,
+                message=layout_message(kind, row),
+                block=local_name(parent.tag), row=row, rendering=rendered))
     return '\n'.join(err_list) + '\n\n' + rendered
 
 # Validate entire table
 def check_table(node):
     """Validate <table>, <informaltable> or <entrytbl> element"""
-    tr_list = node.xpath('.//tr|.//d:tr', namespaces=docbook_nsmap)
-    row_list = node.xpath('.//row|.//d:row', namespaces=docbook_nsmap)
+    tr_list = list(node.iter('tr', docbook_prefix + 'tr'))
+    row_list = list(node.iter('row', docbook_prefix + 'row'))
 
     if len(tr_list) > 0 and len(row_list) > 0:
         raise DocBookError(node, 'Table cannot contain both CALS and HTML elements')
@@ -436,34 +624,439 @@ def check_table(node):
 
     table.validate()
 
+def parse_file(filename):
+    """Parse DocBook file and resolve XIncludes."""
+    parser = etree.XMLParser(load_dtd=True, huge_tree=True)
+    xml = etree.parse(filename, parser)
+    xml.xinclude()
+    return xml
+
+def dom_tables(filename):
+    """Yield tables of DocBook file from the complete, XIncluded tree."""
+    xml = parse_file(filename)
+    yield from xml.xpath(table_xpath, namespaces=docbook_nsmap)
+
+def resolve_xincludes(elem):
+    """
+    Copy element into a separate tree and resolve XIncludes there.
+    Return the copy's new parent.
+    """
+    wrapper = etree.Element('wrapper')
+    wrapper.set(xml_base, elem.base)
+    wrapper.append(copy.deepcopy(elem))
+    etree.ElementTree(wrapper).xinclude()
+    return wrapper
+
+def subtables(elem):
+    """List table and all nested tables in document order."""
+    if any(item.tag in xinclude_tags for item in elem.iter()):
+        elem = resolve_xincludes(elem)
+    return elem.xpath(subtable_xpath, namespaces=docbook_nsmap)
+
+class IncludedSource:
+    """
+    Included file for iterparse(), with the URL the elements report as
+    their base. lxml takes the URL of a file object from geturl().
+    """
+
+    def __init__(self, fh, url):
+        self.fh = fh
+        self.url = url
+
+    def read(self, size=-1):
+        return self.fh.read(size)
+
+    def geturl(self):
+        return self.url
+
+def include_location(base, href):
+    """
+    Return the path of the file included by href and the base its
+    elements report, like after xinclude() in DOM mode: libxml2 only adds
+    xml:base to included content from another directory, otherwise it
+    keeps the base of the <xi:include> element. Like URLs, the path is
+    normalized.
+    """
+    if re.match('[a-zA-Z][a-zA-Z0-9+.-]+:', base):
+        path = urljoin(base, href)
+        return path, path
+    path = os.path.normpath(os.path.join(os.path.dirname(base), href))
+    if '/' in os.path.relpath(path, os.path.dirname(base) or os.curdir):
+        return path, path
+    return path, base
+
+def fallback_tables(elem, path):
+    """
+    Yield tables of the <xi:fallback> of an <xi:include> element whose
+    file could not be loaded. Without fallback, raise XIncludeError like
+    xinclude() does.
+    """
+    for fallback in elem.iterchildren(*fallback_tags):
+        for child in fallback.iterchildren(etree.Element):
+            yield from subtables(child)
+        return
+    raise etree.XIncludeError('could not load %s, and no fallback was '
+        'found, line %d' % (path, elem.sourceline))
+
+def included_tables(elem):
+    """Yield tables of file included by <xi:include> element."""
+    href = elem.attrib.get('href')
+    if not href or elem.attrib.get('parse', 'xml') != 'xml':
+        return
+    if elem.attrib.get('xpointer') is not None:
+        # Only a part of the file is included, so parse all of it
+        yield from subtables(resolve_xincludes(elem))
+        return
+    path, base = include_location(elem.base, href)
+    try:
+        fh = open(path, 'rb')
+    except OSError:
+        fh = None
+    if fh is None:
+        yield from fallback_tables(elem, path)
+        return
+    with fh:
+        yield from stream_tables(IncludedSource(fh, base))
+
+def stream_tables(source):
+    """
+    Yield tables of DocBook file (filename or file object) in document
+    order, parsing it incrementally. Each table is yielded when its end tag
+    is reached, the content before it is removed from the tree afterwards.
+    So only the current table (with nested tables) and its ancestors are
+    kept in memory. XIncludes are followed recursively; the content of
+    <xi:fallback> is kept until its include is known to fail.
+    """
+    context = etree.iterparse(source, events=('start', 'end'),
+        load_dtd=True, huge_tree=True)
+    opentables = 0
+    fallbacks = 0
+    for event, elem in context:
+        if event == 'start':
+            if elem.tag in table_tags:
+                opentables += 1
+            elif elem.tag in fallback_tags:
+                fallbacks += 1
+            continue
+
+        if elem.tag in table_tags:
+            opentables -= 1
+            if opentables == 0 and fallbacks == 0:
+                yield from subtables(elem)
+        elif elem.tag in fallback_tags:
+            fallbacks -= 1
+            continue
+        elif opentables == 0 and fallbacks == 0 and elem.tag in xinclude_tags:
+            yield from included_tables(elem)
+
+        if opentables == 0 and fallbacks == 0:
+            elem.clear(keep_tail=True)
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+    del context
+
+def validator_version():
+    """Hash of this script and lxml version, to invalidate cached results."""
+    digest = hashlib.sha256(etree.__version__.encode())
+    with open(os.path.abspath(__file__), 'rb') as fh:
+        digest.update(fh.read())
+    return digest.hexdigest()
+
+def default_cachedir():
+    """Return the default directory of the result cache or None."""
+    if os.environ.get(cache_env) == '0':
+        return None
+    cachehome = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cachehome, 'daps', 'tables')
+
+class ResultCache:
+    """
+    Persistent cache of table validation results.
+    The key is a hash of the canonical form (C14N) of the table, so the
+    result is reused for unchanged tables, wherever they are. Each result
+    is a file in a directory per validator version: empty for valid tables,
+    the error message for invalid tables. The element_info() locations in
+    the message are stored as placeholders and filled in when replayed.
+    """
+
+    def __init__(self, cachedir):
+        self.cachedir = os.path.join(cachedir, validator_version()[:16])
+
+    def path(self, table):
+        """Return the cache file of table."""
+        key = hashlib.sha256(etree.tostring(table, method='c14n')).hexdigest()
+        return os.path.join(self.cachedir, key[:2], key)
+
+    def get(self, path):
+        """Return the cached message ('' for valid tables) or None."""
+        try:
+            with open(path, 'r', encoding='UTF-8') as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def set(self, path, message):
+        """Store the message atomically, ignore errors."""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w', encoding='UTF-8') as fh:
+                fh.write(message)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+def error_template(table, message, issues):
+    """
+    Replace element_info() of the table's elements in the message with
+    placeholders and the elements in the issues with their index.
+    Return the cache entry.
+    """
+    elements = list(table.iter(etree.Element))
+    infos = [(element_info(elem), i) for i, elem in enumerate(elements)]
+    # longer strings first, a location can be a suffix of another one
+    for info, i in sorted(infos, key=lambda item: -len(item[0])):
+        if info in message:
+            message = message.replace(info, '\x00%d\x00' % i)
+    index = {elem: i for i, elem in enumerate(elements)}
+    issues = [dict(issue, element=index[issue['element']]) for issue in issues]
+    return json.dumps(dict(message=message, issues=issues))
+
+def replay_error(table, template):
+    """Return message and issues of the table from the cache entry."""
+    elements = list(table.iter(etree.Element))
+    entry = json.loads(template)
+    message = placeholder.sub(
+        lambda match: element_info(elements[int(match.group(1))]),
+        entry['message'])
+    issues = [dict(issue, element=elements[issue['element']])
+        for issue in entry['issues']]
+    return message, issues
+
+def check_tables(tablist, cachedir=None):
+    """
+    Validate tables, yield error message and list of issues for each
+    invalid table.
+    """
+    cache = ResultCache(cachedir) if cachedir else None
+    for table in tablist:
+        if cache is None:
+            try:
+                check_table(table)
+            except DocBookError as err:
+                yield err.args[0], err.issues
+            continue
+
+        path = cache.path(table)
+        template = cache.get(path)
+        if template is None:
+            try:
+                check_table(table)
+                template = ''
+            except DocBookError as err:
+                template = error_template(table, err.args[0], err.issues)
+            cache.set(path, template)
+        if template:
+            yield replay_error(table, template)
+
+def error_record(issue):
+    """Return JSON record of an issue."""
+    elem = issue['element']
+    return dict(file=elem.base, line=elem.sourceline,
+        tag=local_name(elem.tag) or elem.tag, block=issue.get('block'),
+        row=issue.get('row'), kind=issue['kind'], message=issue['message'],
+        rendering=issue.get('rendering'))
+
+def format_error(message, issues, fmt):
+    """Format error of a table for output."""
+    if fmt == 'jsonl':
+        return ''.join(json.dumps(error_record(issue)) + '\n'
+            for issue in issues)
+    return '%s \n\n' % message
+
+def format_parse_error(filename, error, fmt):
+    """Format XML or XInclude error for output."""
+    if fmt == 'jsonl':
+        return json.dumps(dict(file=filename,
+            line=getattr(error, 'lineno', None), tag=None, block=None,
+            row=None, kind='parse-error', message=str(error),
+            rendering=None)) + '\n'
+    return '%s\n' % error
+
+def output_stream(fmt):
+    """Errors are diagnostics in text format, but data in JSON format."""
+    return sys.stdout if fmt == 'jsonl' else sys.stderr
+
 # Validate DocBook file
-def check_file(filename):
+def check_file(filename, stream=False, cachedir=None, fmt='text'):
     """Validate tables in DocBook file."""
-    parser = etree.XMLParser(load_dtd=True, huge_tree=True)
+    tables = stream_tables if stream else dom_tables
+    out = output_stream(fmt)
+    ret = 0
     try:
-        xml = etree.parse(filename, parser)
-        xml.xinclude()
+        for msg, issues in check_tables(tables(filename), cachedir):
+            out.write(format_error(msg, issues, fmt))
+            out.flush()
+            ret = 1
     except (etree.XIncludeError, etree.XMLSyntaxError) as error:
-        print(error, file=sys.stderr)
+        out.write(format_parse_error(filename, error, fmt))
         sys.exit(10)
-    tablist = xml.xpath('//table|//informaltable|//entrytbl|//d:table|//d:informaltable|//d:entrytbl',
-        namespaces=docbook_nsmap)
-    ret = 0
-    for table in tablist:
+    return ret
+
+def check_file_in_worker(filename, stream=False, cachedir=None, fmt='text'):
+    """
+    Validate tables in DocBook file in a worker process. The output of
+    check_file() is returned instead of printed:
+    (output, tables with errors, traceback or None)
+    """
+    output = []
+    invalid = 0
+    try:
         try:
-            check_table(table)
-        except DocBookError as err:
-            print(err.args[0], '\n', file=sys.stderr)
-            ret = 1
+            tablist = stream_tables if stream else dom_tables
+            for msg, issues in check_tables(tablist(filename), cachedir):
+                output.append(format_error(msg, issues, fmt))
+                invalid += 1
+        except (etree.XIncludeError, etree.XMLSyntaxError) as error:
+            output.append(format_parse_error(filename, error, fmt))
+            sys.exit(10)
+    except:
+        return output, invalid, traceback.format_exc()
+    return output, invalid, None
+
+# Tables of the file in check_file_split(), inherited by the forked workers
+shared_tables = []
+
+def check_shared_part(part, parts, cachedir=None, fmt='text'):
+    """
+    Validate one of several equal parts of shared_tables in a forked worker
+    process, return the output and the number of tables with errors.
+    """
+    start = len(shared_tables) * part // parts
+    stop = len(shared_tables) * (part + 1) // parts
+    output = [format_error(msg, issues, fmt) for msg, issues
+        in check_tables(shared_tables[start:stop], cachedir)]
+    return output, len(output)
+
+def check_file_split(filename, parts, cachedir=None, fmt='text'):
+    """
+    Validate tables in DocBook file in several forked worker processes.
+    The file is parsed only once, each worker validates an index range of
+    the parsed tables. Output and exit code are the same as check_file().
+    """
+    global shared_tables
+    out = output_stream(fmt)
+    try:
+        shared_tables = list(dom_tables(filename))
+    except (etree.XIncludeError, etree.XMLSyntaxError) as error:
+        out.write(format_parse_error(filename, error, fmt))
+        sys.exit(10)
+    parts = min(parts, len(shared_tables))
+    ret = 0
+    try:
+        if parts <= 1:
+            results = iter([check_shared_part(0, 1, cachedir, fmt)])
+        else:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(parts,
+                mp_context=multiprocessing.get_context('fork'))
+            futures = [pool.submit(check_shared_part, part, parts, cachedir,
+                fmt) for part in range(parts)]
+            results = (future.result() for future in futures)
+        # Print the output of each part as soon as it and all the parts
+        # before it are done, like in serial mode
+        for output, invalid in results:
+            out.write(''.join(output))
+            out.flush()
+            if invalid:
+                ret = 1
+    finally:
+        if parts > 1:
+            pool.shutdown(cancel_futures=True)
+        shared_tables = []
     return ret
 
-if __name__ == '__main__':
+def check_each(filenames, check, *args):
+    """Validate files one after the other with check(filename, *args)."""
     ret = 0
-    for filename in sys.argv[1:]:
+    for filename in filenames:
         try:
-            ret |= check_file(filename)
+            ret |= check(filename, *args)
         except:
             print('Error checking file %s:' % filename, file=sys.stderr)
             traceback.print_exc()
             ret |= 2
-    exit(ret)
+    return ret
+
+def can_fork():
+    """Return whether worker processes can inherit parsed documents."""
+    import multiprocessing
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def check_files(filenames, jobs=1, stream=False, cachedir=None, fmt='text'):
+    """
+    Validate tables in all DocBook files, return the exit code.
+    With more than one job, files are distributed to a process pool. If
+    there are fewer files than jobs (and not in streaming mode), each file
+    is parsed once and its tables are distributed to forked workers
+    instead. Output and exit code are the same as in serial mode.
+    """
+    if jobs <= 1 or not filenames:
+        return check_each(filenames, check_file, stream, cachedir, fmt)
+
+    parts = 1 if stream else jobs // len(filenames)
+    if parts > 1 and can_fork():
+        return check_each(filenames, check_file_split, parts, cachedir, fmt)
+
+    # Importing multiprocessing is slow, only do it when needed
+    from concurrent.futures import ProcessPoolExecutor
+    ret = 0
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(check_file_in_worker, filename, stream,
+                cachedir, fmt) for filename in filenames]
+        for filename, future in zip(filenames, futures):
+            output, invalid, trace = future.result()
+            output_stream(fmt).write(''.join(output))
+            output_stream(fmt).flush()
+            if invalid:
+                ret |= 1
+            if trace is not None:
+                print('Error checking file %s:' % filename, file=sys.stderr)
+                sys.stderr.write(trace)
+                ret |= 2
+    return ret
+
+def parse_args(args=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Validate that DocBook tables are properly formatted')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+        help='Number of worker processes, 0 means one per CPU (default: 1)')
+    parser.add_argument('-s', '--stream', action='store_true',
+        help='Parse files incrementally and validate each table as soon as '
+        'it is complete. Memory use depends on the largest table, not on '
+        'the size of the document')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+        help='Validate all tables, do not use the results cached in '
+        '$XDG_CACHE_HOME/daps/tables (also disabled with %s=0)' % cache_env)
+    parser.add_argument('-f', '--format', choices=('text', 'jsonl'),
+        default='text',
+        help='Output format of table errors: text messages on stderr or '
+        'one JSON object per error on stdout (default: text)')
+    parser.add_argument('files', metavar='FILE', nargs='*',
+        help='DocBook files to check')
+    args = parser.parse_args(args)
+    if args.jobs < 0:
+        parser.error('--jobs must not be negative')
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+if __name__ == '__main__':
+    args = parse_args()
+    cachedir = default_cachedir() if args.cache else None
+    exit(check_files(args.files, args.jobs, args.stream, cachedir,
+        args.format))
@@ -73,6 +73,14 @@ else
   XMLSTARLET := /usr/bin/xmlstarlet
 endif
 
+#--------------------------------------------------
+# Python helper scripts
+#
+# $(call python_helper,SCRIPT) runs a Python helper script of LIBEXEC_DIR
+# with the daps-pyd daemon if PYTHON_DAEMON is "yes" and directly otherwise
+
+python_helper = $(if $(filter yes,$(strip $(PYTHON_DAEMON))),$(LIBEXEC_DIR)/daps-pyd run $(1),$(LIBEXEC_DIR)/$(1))
+
 #--------------------------------------------------
 # VERBOSITY
 #
@@ -100,7 +100,15 @@ profile: $(PROFILES)
 # linking the entity files is not needed when profiling, because the
 # entities are already resolved
 #
-$(PROFILEDIR)/%.xml: $(SRC_DIR)/%.xml $(ENTITIES_DOC) $(DOCCONF) | $(PROFILEDIR)
+# Each profiled file only depends on the entity files it really uses
+# (see ENTITIES_DEPS_TMP in setfiles.mk). If these are unknown, fall back
+# to all entity files.
+#
+$(foreach p,$(PROFILES),$(eval $(p): $(if \
+  $(filter-out undefined,$(origin ENTITIES_DEPS_$(subst $(PROFILEDIR)/,$(SRC_DIR)/,$(p)))),\
+  $(ENTITIES_DEPS_$(subst $(PROFILEDIR)/,$(SRC_DIR)/,$(p))),$(ENTITIES_DOC))))
+
+$(PROFILEDIR)/%.xml: $(SRC_DIR)/%.xml $(DOCCONF) | $(PROFILEDIR)
     ifeq "$(VERBOSITY)" "2"
 	@echo -en "\r   Profiling $<\n"
     endif
@@ -95,7 +95,14 @@ endif
 
 # Entity files
 #
-ENTITIES_DOC := $(shell $(LIBEXEC_DIR)/getentityname.py $(DOCFILES) 2>/dev/null)
+# ENTITIES_DOC contains all entity files used by DOCFILES. Additionally,
+# the entity files each XML file depends on (directly or via nested
+# entity files) are written to ENTITIES_DEPS_TMP as
+# ENTITIES_DEPS_<xmlfile> variables (used in profiling.mk)
+#
+ENTITIES_DEPS_TMP := $(SETFILES_TMP).entities.mk
+ENTITIES_DOC := $(shell $(call python_helper,getentityname.py) --make-deps $(ENTITIES_DEPS_TMP) $(DOCFILES) 2>/dev/null)
+-include $(ENTITIES_DEPS_TMP)
 
 
 # files xi:included with parse="text"
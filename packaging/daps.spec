@@ -123,7 +123,8 @@ converting DocBook XML.
 
 # Correct shebang line as suggested in
 # https://lists.opensuse.org/opensuse-packaging/2018-03/msg00017.html
-sed -i '1 s|/usr/bin/env python|/usr/bin/python|' libexec/daps-xmlwellformed \
+sed -i '1 s|/usr/bin/env python|/usr/bin/python|' libexec/daps-pyd \
+  libexec/daps-xmlwellformed \
   libexec/getentityname.py \
   libexec/validate-tables.py
 
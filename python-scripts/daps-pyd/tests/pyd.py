@@ -0,0 +1 @@
+../bin/daps-pyd
\ No newline at end of file
@@ -0,0 +1,181 @@
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+import pytest
+
+# "pyd" is the abbreviated name for daps-pyd
+# We can't import a name with a "-" so we use a link here:
+import pyd
+
+PYD = str(Path(__file__).parent / "pyd.py")
+
+GOOD = """<informaltable xmlns="http://docbook.org/ns/docbook">
+ <tgroup cols="2"><tbody>
+  <row><entry>a</entry><entry>b</entry></row>
+ </tbody></tgroup>
+</informaltable>
+"""
+# The second row has a hole
+BAD = GOOD.replace("</row>", "</row><row><entry>c</entry></row>")
+
+
+@pytest.fixture
+def env(tmp_path_factory, monkeypatch):
+    """Environment with a socket path of its own; the daemon is not started.
+    The socket path must be short, so it is not in tmp_path."""
+    socket = str(tmp_path_factory.mktemp("pyd") / "pyd.sock")
+    monkeypatch.setenv(pyd.SOCKET_ENV, socket)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path_factory.mktemp("cache")))
+    return dict(os.environ)
+
+
+@pytest.fixture
+def daemon(env):
+    """The socket path of a running daemon"""
+    subprocess.run([sys.executable, PYD, "--idle-timeout", "60", "start"],
+                   env=env, check=True)
+    yield env[pyd.SOCKET_ENV]
+    subprocess.run([sys.executable, PYD, "stop"], env=env, check=True)
+    wait_until_stopped(env[pyd.SOCKET_ENV])
+
+
+@pytest.fixture
+def tables(tmp_path):
+    """Files with valid and invalid tables"""
+    for name, content in (("good.xml", GOOD), ("bad.xml", BAD)):
+        (tmp_path / name).write_text(content, encoding="UTF-8")
+    return tmp_path
+
+
+def wait_until_stopped(path):
+    """The daemon removes its socket when it stops"""
+    for _ in range(100):
+        if not os.path.exists(path):
+            return
+        time.sleep(0.05)
+    raise AssertionError("daps-pyd did not stop")
+
+
+def pyd_cli(env, *args, cwd=None):
+    """Run daps-pyd, return exit code, stdout, and stderr"""
+    proc = subprocess.run([sys.executable, PYD, *args], env=env, cwd=cwd,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    return proc.returncode, proc.stdout, proc.stderr
+
+
+def script_cli(env, script, *args, cwd=None):
+    """Run a script directly, return exit code, stdout, and stderr"""
+    proc = subprocess.run([sys.executable,
+                           os.path.join(pyd.LIBEXEC_DIR, script), *args],
+                          env=env, cwd=cwd,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    return proc.returncode, proc.stdout, proc.stderr
+
+
+def test_status_not_running(env):
+    # When
+    result, out, _ = pyd_cli(env, "status")
+
+    # Then
+    assert result == 3
+    assert out == "daps-pyd is not running (%s)\n" % env[pyd.SOCKET_ENV]
+
+
+def test_start_status_stop(env):
+    # When
+    started = pyd_cli(env, "start")
+    running = pyd_cli(env, "status")
+    started_again = pyd_cli(env, "start")
+    stopped = pyd_cli(env, "stop")
+    wait_until_stopped(env[pyd.SOCKET_ENV])
+    not_running = pyd_cli(env, "status")
+
+    # Then
+    assert started[0] == 0
+    assert running[0] == 0
+    assert running[1].startswith("daps-pyd %s is running with PID "
+                                 % pyd.__version__)
+    assert started_again[0] == 0
+    assert stopped[0] == 0
+    assert not_running[0] == 3
+
+
+def test_socket_is_private(daemon):
+    assert os.stat(daemon).st_mode & 0o077 == 0
+
+
+def test_request_passes_file_descriptors(daemon, tables):
+    # Given
+    stdin = os.open(os.devnull, os.O_RDONLY)
+    outr, outw = os.pipe()
+    errr, errw = os.pipe()
+    message = dict(script="validate-tables.py", argv=["bad.xml"],
+                   cwd=str(tables), env=dict(os.environ))
+
+    # When
+    try:
+        reply = pyd.request(daemon, message, (stdin, outw, errw))
+    finally:
+        for fd in (stdin, outw, errw):
+            os.close(fd)
+    with open(outr) as out, open(errr) as err:
+        out, err = out.read(), err.read()
+
+    # Then
+    # A reply at all shows that the daemon ran the script, not a fallback
+    assert reply == dict(status=1)
+    assert out == ""
+    assert "Errors in table:" in err
+
+
+@pytest.mark.parametrize("args", [
+    ["good.xml"],
+    ["bad.xml"],
+    ["missing.xml"],
+    ["--format", "jsonl", "bad.xml"],
+    ["--unknown-option"],
+])
+def test_run_same_as_direct_call(daemon, env, tables, args):
+    # Given
+    expected = script_cli(env, "validate-tables.py", *args, cwd=tables)
+
+    # When
+    result = pyd_cli(env, "run", "validate-tables.py", *args, cwd=tables)
+
+    # Then
+    assert result[0] == expected[0]
+    assert result[1] == expected[1]
+    # Tracebacks contain the file name of the script
+    assert result[2].split("Traceback")[0] == \
+        expected[2].split("Traceback")[0]
+
+
+def test_run_exit_codes(daemon, env, tables):
+    # When
+    results = [pyd_cli(env, "run", "validate-tables.py", name, cwd=tables)[0]
+               for name in ("good.xml", "bad.xml", "missing.xml")]
+
+    # Then
+    assert results == [0, 1, 2]
+
+
+def test_run_without_daemon(env, tables):
+    # Given
+    expected = script_cli(env, "getentityname.py", "--json", "good.xml",
+                          cwd=tables)
+
+    # When
+    result = pyd_cli(env, "run", "getentityname.py", "--json", "good.xml",
+                     cwd=tables)
+    status = pyd_cli(env, "status")
+
+    # Then
+    assert status[0] == 3
+    assert result == expected
+    assert json.loads(result[1])["file"].endswith("good.xml")
@@ -62,3 +62,126 @@ def test_main_one_good_one_bad(caplog):
     assert len(caplog.records) == len(messages)
     for record, msg in zip(caplog.records, messages):
         assert record.msg == msg
+
+
+@pytest.mark.parametrize("options", [
+    ["--xinclude", "--stats"],
+    ["--xinclude", "-W"],
+    [],
+])
+def test_main_jobs_same_as_serial(caplog, options):
+    # Given
+    files = [str(f) for d in (GOODDIR, BADDIR) for f in sorted(d.glob("*.xml"))]
+
+    def run(*jobs):
+        caplog.clear()
+        with caplog.at_level(logging.ERROR):
+            result = dxwf.main([*jobs, *options, *files])
+        records = [(r.levelno, r.file, r.msg) for r in caplog.records
+                   if r.name == dxwf.ROOTLOGGER]
+        return result, records
+
+    # When
+    serial = run()
+    parallel = run("--jobs", "3")
+
+    # Then
+    assert parallel == serial
+
+
+def write_book(path, entity="name"):
+    (path / "book.ent").write_text(f'<!ENTITY {entity} "Penguin">\n')
+    (path / "chapter.xml").write_text(
+        '<!DOCTYPE chapter [\n'
+        '  <!ENTITY % ents SYSTEM "book.ent">\n'
+        '  %ents;\n'
+        ']>\n'
+        '<chapter><para>&name;</para></chapter>\n')
+    xi = '<xi:include xmlns:xi="http://www.w3.org/2001/XInclude" href="chapter.xml"/>'
+    for book in ("book1.xml", "book2.xml"):
+        (path / book).write_text(f"<book>{xi}{xi}</book>\n")
+    return [str(path / book) for book in ("book1.xml", "book2.xml")]
+
+
+def test_check_graph_checks_each_file_once(tmp_path, caplog):
+    # Given
+    files = write_book(tmp_path, entity="other")
+
+    # When
+    with caplog.at_level(logging.ERROR):
+        results = list(dxwf.check_graph(files))
+
+    # Then
+    assert results == [dxwf.ExitCode.xinclude] * 2
+    assert [r.msg for r in caplog.records] == ["Entity 'name' not defined"]
+    assert caplog.records[0].file == str(tmp_path / "chapter.xml")
+
+
+def test_check_graph_cache(tmp_path, monkeypatch):
+    # Given
+    books = tmp_path / "books"
+    books.mkdir()
+    files = write_book(books)
+    cachedir = str(tmp_path / "cache")
+    list(dxwf.check_graph(files, cachedir=cachedir))
+    scanned = []
+    scan = dxwf.Checker.scan
+    def spy(self, xmlfile):
+        scanned.append(xmlfile)
+        return scan(self, xmlfile)
+    monkeypatch.setattr(dxwf.Checker, "scan", spy)
+
+    # When
+    warm = list(dxwf.check_graph(files, cachedir=cachedir))
+    (books / "book.ent").write_text('<!ENTITY other "Penguin">\n')
+    changed = list(dxwf.check_graph(files, cachedir=cachedir))
+
+    # Then
+    assert warm == [dxwf.ExitCode.ok] * 2
+    assert changed == [dxwf.ExitCode.xinclude] * 2
+    assert scanned == [str(books / "chapter.xml")]
+
+
+@pytest.mark.parametrize("book", ["../book1.xml", "../sub/../book1.xml"])
+def test_check_graph_relative_path_from_other_directory(tmp_path, monkeypatch,
+                                                        caplog, book):
+    # Given
+    write_book(tmp_path, entity="other")
+    (tmp_path / "sub").mkdir()
+    monkeypatch.chdir(tmp_path / "sub")
+
+    # When
+    with caplog.at_level(logging.ERROR):
+        results = list(dxwf.check_graph([book]))
+
+    # Then
+    assert results == [dxwf.ExitCode.xinclude]
+    assert [r.msg for r in caplog.records] == ["Entity 'name' not defined"]
+    assert caplog.records[0].file == "../chapter.xml"
+
+
+def test_check_graph_skips_unused_fallback(tmp_path):
+    # Given
+    (tmp_path / "chapter.xml").write_text("<chapter/>\n")
+    (tmp_path / "broken.xml").write_text("<chapter>\n")
+    ns = 'xmlns:xi="http://www.w3.org/2001/XInclude"'
+    (tmp_path / "book.xml").write_text(
+        f'<book {ns}>\n'
+        '<xi:include href="chapter.xml"><xi:fallback>\n'
+        ' <xi:include href="missing.xml"/>\n'
+        ' <xi:include href="broken.xml"/>\n'
+        '</xi:fallback></xi:include>\n'
+        '<xi:include href="gone.xml"><xi:fallback>\n'
+        ' <xi:include href="chapter.xml"/>\n'
+        '</xi:fallback></xi:include>\n'
+        '</book>\n')
+    book = str(tmp_path / "book.xml")
+
+    # When
+    result = dxwf.Checker().scan(book)
+    graph = list(dxwf.check_graph([book]))
+
+    # Then
+    assert result.result == dxwf.ExitCode.ok
+    assert result.includes == [str(tmp_path / "chapter.xml")] * 2
+    assert graph == [dxwf.ExitCode.ok]
@@ -1,19 +1,41 @@
+import os.path
+import subprocess
+import sys
+
 import pytest
 
+# "dxwf" is the abbreviated name for daps-xmlwellformed
+# We can't import a name with a "-" so we use a link here:
+import dxwf
+
 
 def test_required_lxml(monkeypatch):
     # Given
     from lxml import etree
-    import sys
-
-    module = "dxwf"
-    if module in sys.modules:
-        # Force deleting them if it is already loaded from
-        # other tests
-        del sys.modules[module]
 
     with monkeypatch.context() as m:
-        # simulate a very low version of lxml
+        # simulate a very low version of lxml, which isn't loaded yet
         m.setattr(etree, "LXML_VERSION", (1, 42, 42, 0))
+        m.setattr(dxwf, "etree", None)
+
+        # When, Then
         with pytest.raises(SystemExit):
-            import dxwf
+            dxwf.import_lxml()
+
+
+def test_version_without_lxml():
+    # Given
+    code = ("import sys, dxwf\n"
+            "try:\n"
+            "    dxwf.main(['--version'])\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print('lxml.etree' in sys.modules)\n")
+
+    # When
+    result = subprocess.run([sys.executable, "-c", code],
+                            cwd=os.path.dirname(dxwf.__file__),
+                            stdout=subprocess.PIPE, check=True)
+
+    # Then
+    assert result.stdout.split()[-1] == b"False"
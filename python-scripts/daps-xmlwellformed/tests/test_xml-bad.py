@@ -116,3 +116,18 @@ def test_xinclude_errors(xmlfile, messages, caplog):
     assert len(caplog.records) == len(messages)
     for record, pattern in zip(caplog.records, messages):
         assert re.search(pattern, record.msg)
+
+
+def test_checker_reuse():
+    # Given
+    checker = dxwf.Checker(xinclude=True)
+    bad = str(BADDIR / "test-xinclude-undeclared-entity.xml")
+    good = str(DATADIR / "good" / "test-wents-wxi.xml")
+
+    # When
+    results = [checker.check(f) for f in (bad, good, bad)]
+
+    # Then
+    assert results[0][0] == dxwf.ExitCode.xinclude
+    assert results[1] == (dxwf.ExitCode.ok, [])
+    assert results[2] == results[0]
@@ -6,9 +6,16 @@ linebreaks.
 """
 
 import argparse
+from bisect import bisect_left
+import io
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
 import re
 from lxml import etree
 import sys
+import tempfile
 
 __version__ = "0.2.0"
 __author__ = "Tom Schraitle <toms@suse.de>"
@@ -17,11 +24,14 @@ __author__ = "Tom Schraitle <toms@suse.de>"
 ENTITIES = re.compile(r'&(?!(lt|gt|apos|quot|amp);)([\w\.\-_]+);')
 START_DELIMITER = r"{{{"
 END_DELIMITER = r"}}}"
-MASKED_ENTITIES = re.compile(r'{}([\w\.\-_]+){}'.format(
-    re.escape(START_DELIMITER),
-    re.escape(END_DELIMITER))
-)
 SPACES = re.compile(r' +')
+SCREEN_START = re.compile(r'<screen[\s/>]')
+SCREEN_END = "</screen>"
+# Characters to read at once in the streaming mode
+CHUNK_SIZE = 1 << 16
+
+# An entity reference "&name;" at content[start:end]
+Entity = namedtuple("Entity", ["start", "end", "name"])
 
 
 def stderr(*args, **kwargs):
@@ -42,11 +52,11 @@ def parsecli(cliargs=None) -> argparse.Namespace:
                         version='%(prog)s ' + __version__
                         )
     parser.add_argument("--start-delimiter",
-                        # default=r"{{{",
+                        default=START_DELIMITER,
                         help="The start delimiter for masked entities (default: %(default)s)"
                         )
     parser.add_argument("--end-delimiter",
-                        # default=r"}}}",
+                        default=END_DELIMITER,
                         help="The end delimiter for masked entities (default: %(default)s)"
                         )
     parser.add_argument("--stdout",
@@ -54,28 +64,101 @@ def parsecli(cliargs=None) -> argparse.Namespace:
                         default=False,
                         help="Print the modified content to stdout"
                         )
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of files to process in parallel; 0 uses "
+                        "one per CPU, ignored with --stdout (default: %(default)s)"
+                        )
     parser.add_argument("XMLFILES",
                         # dest="xmlfiles",
                         metavar="XMLFILES",
                         nargs='+',
-                        help="The XML files to search for <screen>"
+                        help="The XML files to search for <screen>; "
+                        "\"-\" streams from stdin to stdout"
                         )
 
-    global MASKED_ENTITIES, START_DELIMITER, END_DELIMITER
     args = parser.parse_args(args=cliargs)
-    if args.start_delimiter is not None:
-        START_DELIMITER = args.start_delimiter
-    if args.end_delimiter is not None:
-        END_DELIMITER = args.end_delimiter
-
-    if args.start_delimiter is not None or args.end_delimiter is not None:
-        MASKED_ENTITIES = re.compile(r'{}(\w+){}'.format(
-            re.escape(START_DELIMITER),
-            re.escape(END_DELIMITER))
-        )
+    if args.jobs < 0:
+        parser.error("--jobs must not be negative")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
+    args.masker = EntityMasker(args.start_delimiter, args.end_delimiter)
     return args
 
 
+class EntityMasker:
+    """
+    Masks entity references, so the parser keeps them as text, and
+    restores them afterwards. The delimiters around the masked names
+    are the configuration; an instance never changes, so one can be
+    shared by threads.
+
+    >>> masker = EntityMasker("[[", "]]")
+    >>> masker.mask_text("a &b; c &lt;")
+    'a [[b]] c &lt;'
+    """
+
+    def __init__(self, start=START_DELIMITER, end=END_DELIMITER):
+        self.start = start
+        self.end = end
+        self.pattern = re.compile(r'{}([\w\.\-_]+){}'.format(
+            re.escape(start), re.escape(end)))
+
+    def find_entities(self, content):
+        """
+        Returns the list of all :class:`Entity` references in content,
+        except for the standard entities &lt;, &gt;, &apos;, &quot;, &amp;.
+        """
+        return [Entity(match.start(), match.end(), match.group(2))
+                for match in ENTITIES.finditer(content)]
+
+    def mask(self, content, start, end, entities):
+        """
+        Returns content[start:end] with the entities in it masked.
+        The entities must be in that range, in document order.
+        """
+        parts = []
+        pos = start
+        for entity in entities:
+            parts.append(content[pos:entity.start])
+            parts.append(self.start + entity.name + self.end)
+            pos = entity.end
+        parts.append(content[pos:end])
+        return "".join(parts)
+
+    def restore(self, text, entities):
+        """
+        Restores the masked entities in text, which was created from
+        the result of :meth:`mask` with the same entities. The masked
+        names are looked up one after the other, each after the
+        previous one; names which went missing are skipped.
+        """
+        parts = []
+        pos = 0
+        for entity in entities:
+            masked = self.start + entity.name + self.end
+            found = text.find(masked, pos)
+            if found == -1:
+                continue
+            parts.append(text[pos:found])
+            parts.append("&" + entity.name + ";")
+            pos = found + len(masked)
+        parts.append(text[pos:])
+        return "".join(parts)
+
+    def mask_text(self, text):
+        """Returns text with all entities masked"""
+        return self.mask(text, 0, len(text), self.find_entities(text))
+
+    def is_masked(self, text):
+        """Checks if text contains a masked entity"""
+        return self.pattern.search(text) is not None
+
+
+DEFAULT_MASKER = EntityMasker()
+
+
 def xmlparser(**args):
     """Return a new XML parser object"""
     return etree.XMLParser(recover=True, **args)
@@ -95,42 +178,63 @@ def replace_entities_with_braces(text, start=START_DELIMITER, end=END_DELIMITER)
     Replaces entities in the text with curly braces, except for the
     standard entities &lt;, &gt;, &apos;, &quot;.
     """
-    # Replace the matched entities with curly braces
-    replacement = r'{}\2{}'.format(start, end)
-    return ENTITIES.sub(replacement, text)
+    return EntityMasker(start, end).mask_text(text)
 
 
-def restore_entities_from_braces(text):
+def restore_entities_from_braces(text, masker=DEFAULT_MASKER):
     """
     Restores masked entities from curly braces back to their original form with ampersand.
+    Unlike :meth:`EntityMasker.restore`, this searches for any masked name.
     """
-    # Define a regex pattern to match masked entities (e.g., {name})
-
-    # Replace the masked entities with their original form
-    return MASKED_ENTITIES.sub(r'&\1;', text)
+    return masker.pattern.sub(r'&\1;', text)
 
 
-def extract_screen_blocks(content):
+def find_screens(content):
     """
-    Extracts all lines between <screen> and </screen> tags, including the tags.
+    Returns the (start, end) offsets of all <screen> elements in content,
+    from the "<" of the start tag to the ">" of the end tag.
     """
-    screen_blocks = []
-    current_block = []
-    inside_screen = False
-
-    for line in content.splitlines(keepends=True):
-        if "<screen" in line:
-            inside_screen = True
-
-        if inside_screen:
-            current_block.append(replace_entities_with_braces(line))
+    spans = []
+    pos = 0
+    while True:
+        match = SCREEN_START.search(content, pos)
+        if match is None:
+            break
+        start = match.start()
+        tag_end = content.find(">", start)
+        if tag_end != -1 and content[tag_end - 1] == "/":
+            # An empty <screen/> has nothing to fix, skip it
+            pos = tag_end + 1
+            continue
+        end = content.find(SCREEN_END, start)
+        if end == -1:
+            break
+        pos = end + len(SCREEN_END)
+        spans.append((start, pos))
+    return spans
+
+
+def screen_entities(content, spans, masker=DEFAULT_MASKER):
+    """
+    Finds the entities of content in one pass and returns the list of
+    entities in each span.
+    """
+    entities = masker.find_entities(content)
+    starts = [entity.start for entity in entities]
+    return [entities[bisect_left(starts, start):bisect_left(starts, end)]
+            for start, end in spans]
 
-        if "</screen>" in line:
-            inside_screen = False
-            screen_blocks.append("".join(current_block))
-            current_block = []
 
-    return screen_blocks
+def extract_screen_blocks(content, spans=None, entities=None, masker=DEFAULT_MASKER):
+    """
+    Extracts all <screen> elements, with masked entities.
+    """
+    if spans is None:
+        spans = find_screens(content)
+    if entities is None:
+        entities = screen_entities(content, spans, masker)
+    return [masker.mask(content, start, end, inside)
+            for (start, end), inside in zip(spans, entities)]
 
 
 def modify_screen_with_text_only(screen):
@@ -157,11 +261,11 @@ def group_by_prompt(screen):
     return grouped
 
 
-def modify_screen_with_prompt(screen):
+def modify_screen_with_prompt(screen, masker=DEFAULT_MASKER):
     if screen.xpath("*[1][self::prompt]") and screen.text is not None:
         # Remove any whitespace between <screen> and <prompt>
         screen.text = screen.text.lstrip()
-    if screen.text is not None and MASKED_ENTITIES.search(screen.text):
+    if screen.text is not None and masker.is_masked(screen.text):
         screen.text = screen.text.lstrip()
     # Group the elements by <prompt> and non-prompt elements.
     # (<prompt>, <command>, <command>, <prompt>, <command>, ...) =>
@@ -180,73 +284,216 @@ def modify_screen_with_prompt(screen):
 
 
 
-def modify_screen_content(screen_content: str) -> str:
+def modify_screen_content(screen_content: str, parser=None, masker=DEFAULT_MASKER) -> str:
     """
     Parses the <screen> content using lxml.etree, modifies it, and returns the modified string.
+    The parser can be reused for all screens.
     """
     # Parse the content as XML
-    screen = etree.fromstring(screen_content, parser=xmlparser())
+    screen = etree.fromstring(screen_content,
+                              parser=xmlparser() if parser is None else parser)
 
     has_text_only = is_screen_content_text_only(screen)
     # Case 1: The content starts with an entity
-    if screen.text is not None and MASKED_ENTITIES.search(screen.text):
+    if screen.text is not None and masker.is_masked(screen.text):
         screen.text = screen.text.lstrip()
     # Case 2: The content contains only text
     elif has_text_only:
         modify_screen_with_text_only(screen)
     # Case 3: The content contains child elements and starts with a <prompt> element
     elif screen.xpath("*[1][self::prompt]"):
-        modify_screen_with_prompt(screen)
+        modify_screen_with_prompt(screen, masker)
 
     # Return the modified XML as a string
     return etree.tostring(screen, encoding="unicode")
 
 
-def replace_screen_blocks(content, modified_blocks):
+def replace_screen_blocks(content, spans, modified_blocks, entities=None,
+                          masker=DEFAULT_MASKER):
     """
-    Replaces the original <screen> blocks with the modified content.
+    Replaces the <screen> elements at the spans of find_screens() with
+    the modified content, in one pass.
     """
-    for original, modified in modified_blocks:
-        restored_modified = restore_entities_from_braces(modified)
-        content = content.replace(original.rstrip(), restored_modified)
-    return content
-
-
-def process_file(xmlfile, stdout=False):
+    if entities is None:
+        entities = screen_entities(content, spans, masker)
+    parts = []
+    pos = 0
+    for (start, end), modified, inside in zip(spans, modified_blocks, entities):
+        parts.append(content[pos:start])
+        parts.append(masker.restore(modified, inside))
+        pos = end
+    parts.append(content[pos:])
+    return "".join(parts)
+
+
+def fix_content(content, masker=DEFAULT_MASKER, parser=None):
     """
-    Orchestrates the extraction, modification, and replacement of <screen> blocks.
+    Returns the content with all <screen> blocks modified, or None if
+    there is no <screen>.
     """
-    with open(xmlfile, 'r') as file:
-        content = file.read()
-
     # Step 2: Extract <screen> blocks
-    screen_blocks = extract_screen_blocks(content)
+    spans = find_screens(content)
+    entities = screen_entities(content, spans, masker)
+    screen_blocks = extract_screen_blocks(content, spans, entities, masker)
 
     # Check if any <screen> blocks were found
     if not screen_blocks:
-        stderr(f"Skip {xmlfile}: No <screen> content found.")
-        return
+        return None
 
     # Step 3: Modify each <screen> block
-    modified_blocks = [(block, modify_screen_content(block)) for block in screen_blocks]
+    if parser is None:
+        parser = xmlparser()
+    modified_blocks = [modify_screen_content(block, parser, masker)
+                       for block in screen_blocks]
 
     # Step 4: Replace original blocks with modified ones
-    modified_content = replace_screen_blocks(content, modified_blocks)
+    return replace_screen_blocks(content, spans, modified_blocks, entities, masker)
+
+
+def fix_stream(instream, outstream, masker=DEFAULT_MASKER, chunk_size=CHUNK_SIZE):
+    """
+    Copies instream to outstream and modifies the <screen> blocks on
+    the way. Text outside of <screen> is copied as it is read; only one
+    <screen> at a time is kept in memory.
+
+    :return: "changed", "unchanged", or "skipped" (no <screen>)
+    """
+    result = "skipped"
+    parser = xmlparser()
+    buffer = instream.read(chunk_size)
+    eof = not buffer
+
+    while True:
+        match = SCREEN_START.search(buffer)
+        if match is None:
+            if eof:
+                outstream.write(buffer)
+                return result
+            # Keep what could be the beginning of a cut "<screen"
+            keep = max(0, len(buffer) - len("<screen"))
+            outstream.write(buffer[:keep])
+            buffer = buffer[keep:]
+        else:
+            outstream.write(buffer[:match.start()])
+            buffer = buffer[match.start():]
+            end = screen_end(buffer)
+            if end is not None:
+                block, buffer = buffer[:end], buffer[end:]
+                modified = fix_content(block, masker, parser)
+                if modified is None:
+                    # An empty <screen/>
+                    outstream.write(block)
+                    continue
+                outstream.write(modified)
+                if modified != block:
+                    result = "changed"
+                elif result == "skipped":
+                    result = "unchanged"
+                continue
+            if eof:
+                # An unterminated <screen> is left as it is
+                outstream.write(buffer)
+                return result
+
+        chunk = instream.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def screen_end(buffer):
+    """
+    Returns the offset after the <screen> element at the start of the
+    buffer, or None if the buffer doesn't contain all of it yet.
+    """
+    tag_end = buffer.find(">")
+    if tag_end == -1:
+        return None
+    if buffer[tag_end - 1] == "/":
+        return tag_end + 1
+    end = buffer.find(SCREEN_END, tag_end)
+    if end == -1:
+        return None
+    return end + len(SCREEN_END)
+
+
+def process_stream(masker=DEFAULT_MASKER):
+    """
+    Fixes the <screen> blocks from stdin to stdout. The data is read
+    and written as UTF-8, with line endings kept as they are.
+    """
+    instream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    outstream = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="")
+    try:
+        return fix_stream(instream, outstream, masker)
+    finally:
+        outstream.flush()
+        outstream.detach()
+        instream.detach()
+
+
+def write_atomically(xmlfile, content):
+    """
+    Writes content to a temporary file next to xmlfile and renames it,
+    so xmlfile is never left half-written. Keeps the permissions.
+    """
+    mode = os.stat(xmlfile).st_mode
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(xmlfile)),
+                               prefix=".fix-screen-")
+    try:
+        with open(fd, 'w', newline='') as file:
+            file.write(content)
+        os.chmod(tmp, mode)
+        os.replace(tmp, xmlfile)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def process_file(xmlfile, stdout=False, masker=DEFAULT_MASKER):
+    """
+    Orchestrates the extraction, modification, and replacement of <screen> blocks.
+    Only writes the file if it changed.
+
+    :return: "changed", "unchanged", or "skipped" (no <screen>)
+    """
+    if xmlfile == "-":
+        return process_stream(masker)
+
+    # Keep line endings as they are, for comparing the content
+    with open(xmlfile, 'r', newline='') as file:
+        content = file.read()
+
+    modified_content = fix_content(content, masker)
+    if modified_content is None:
+        stderr(f"Skip {xmlfile}: No <screen> content found.")
+        return "skipped"
 
     # Step 5: Output the modified content
-    if not stdout:
-        stderr(f"Would write to {xmlfile}")
-        with open(xmlfile, 'w') as file:
-            file.write(modified_content)
-    else:
+    if stdout:
         print(modified_content)
+    if modified_content == content:
+        return "unchanged"
+    if not stdout:
+        write_atomically(xmlfile, modified_content)
+    return "changed"
 
 
 def main(cliargs=None):
     args = parsecli(cliargs)
     stderr(">>> args:", args)
-    for xmlfile in args.XMLFILES:
-        process_file(xmlfile, args.stdout)
+    if args.jobs > 1 and not args.stdout and len(args.XMLFILES) > 1 \
+            and "-" not in args.XMLFILES:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            results = list(pool.map(partial(process_file, masker=args.masker),
+                                    args.XMLFILES, chunksize=8))
+    else:
+        results = [process_file(xmlfile, args.stdout, args.masker)
+                   for xmlfile in args.XMLFILES]
+
+    verb = "Would change" if args.stdout else "Changed"
+    stderr(f"{verb} {results.count('changed')} file(s), "
+           f"{results.count('unchanged')} unchanged, "
+           f"{results.count('skipped')} without <screen>")
 
 
 if __name__ == "__main__":
@@ -13,7 +13,7 @@ def test_extract_screen_block():
     """
     result = screen.extract_screen_blocks(content)
     assert len(result)
-    assert result[0] == '    <screen>\n    This is a screen\n    block\n    </screen>\n'
+    assert result[0] == '<screen>\n    This is a screen\n    block\n    </screen>'
 
 
 def test_extract_screen_block_with_entity():
@@ -28,10 +28,10 @@ def test_extract_screen_block_with_entity():
     result = screen.extract_screen_blocks(content)
     assert len(result)
     assert result[0] == (
-        '    <screen>\n'
+        '<screen>\n'
         '    This is a screen with an entity &lt;\n'
         '    block\n'
-        '    </screen>\n'
+        '    </screen>'
     )
     assert "&lt;" in result[0]
 
@@ -48,10 +48,10 @@ def test_extract_screen_block_with_non_std_entity():
     result = screen.extract_screen_blocks(content)
     assert len(result)
     assert result[0] == (
-        '    <screen>\n    '
+        '<screen>\n    '
         'This is a screen with an entity '
         f'{screen.START_DELIMITER}hello{screen.END_DELIMITER}\n'
-        '    block\n    </screen>\n')
+        '    block\n    </screen>')
 
 
 def test_extract_screen_block_with_childelements():
@@ -66,7 +66,20 @@ def test_extract_screen_block_with_childelements():
     result = screen.extract_screen_blocks(content)
     assert len(result)
     assert result[0] == (
-        '    <screen>\n'
+        '<screen>\n'
         '    <prompt>&lt;</prompt>\n'
         '    <command>ls</command>\n'
-        '    </screen>\n')
\ No newline at end of file
+        '    </screen>')
+
+def test_find_screens():
+    content = (
+        '<para>Hello <screen>a</screen></para>\n'
+        '<screen/>\n'
+        '<screenshot/>\n'
+        '<screen language="sh">b</screen>'
+    )
+    spans = screen.find_screens(content)
+    assert [content[start:end] for start, end in spans] == [
+        '<screen>a</screen>',
+        '<screen language="sh">b</screen>',
+    ]
@@ -51,3 +51,24 @@ def test_restore_entities_from_braces(text):
         f"{screen.START_DELIMITER}{name}{screen.END_DELIMITER}"
     )
     assert result == text
+
+
+def test_masker_restore_by_offset():
+    masker = screen.EntityMasker("<<", ">>")
+    text = "&a; x &lt; &b.c; &a;"
+    entities = masker.find_entities(text)
+    masked = masker.mask(text, 0, len(text), entities)
+    assert masked == "<<a>> x &lt; <<b.c>> <<a>>"
+    assert masker.restore("  " + masked.replace(" x", ""), entities) == \
+        "  &a; &lt; &b.c; &a;"
+
+
+def test_maskers_in_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    content = "<screen>\n  &prompt.root;\n</screen> <screen>\n<prompt>&a;</prompt>\n  <command>ls</command>\n</screen>"
+    maskers = [screen.EntityMasker(f"[{i}[", f"]{i}]") for i in range(8)]
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda m: screen.fix_content(content, m),
+                                maskers * 10))
+    assert set(results) == {screen.fix_content(content)}
@@ -84,10 +84,12 @@ def test_replace_screen_blocks():
         "Hello World</screen>\n"
         "<para>Other text</para>"
     )
-    screen_blocks = screen.extract_screen_blocks(content)
-    modified_blocks = [(block, screen.modify_screen_content(block))
+    spans = screen.find_screens(content)
+    screen_blocks = screen.extract_screen_blocks(content, spans)
+    modified_blocks = [screen.modify_screen_content(block)
                        for block in screen_blocks]
-    modified_content = screen.replace_screen_blocks(content, modified_blocks)
+    modified_content = screen.replace_screen_blocks(content, spans,
+                                                    modified_blocks)
 
     assert modified_content == (
         "<para>Some text</para>\n"
@@ -108,11 +110,12 @@ def test_replace_screen_blocks_with_prompt_entity():
         "    </screen>\n"
         "<para>Other text</para>"
     )
-    content = screen.replace_entities_with_braces(content)
-    screen_blocks = screen.extract_screen_blocks(content)
-    modified_blocks = [(block, screen.modify_screen_content(block))
+    spans = screen.find_screens(content)
+    screen_blocks = screen.extract_screen_blocks(content, spans)
+    modified_blocks = [screen.modify_screen_content(block)
                        for block in screen_blocks]
-    modified_content = screen.replace_screen_blocks(content, modified_blocks)
+    modified_content = screen.replace_screen_blocks(content, spans,
+                                                    modified_blocks)
     #print(">>> screen_blocks:", screen_blocks)
     #print(">>> modified_blocks:", modified_blocks)
 
@@ -135,10 +138,12 @@ def test_replace_screen_blocks_with_prompt_and_two_commands():
         "</screen>\n"
         "<para>Other text</para>"
     )
-    screen_blocks = screen.extract_screen_blocks(content)
-    modified_blocks = [(block, screen.modify_screen_content(block))
+    spans = screen.find_screens(content)
+    screen_blocks = screen.extract_screen_blocks(content, spans)
+    modified_blocks = [screen.modify_screen_content(block)
                        for block in screen_blocks]
-    modified_content = screen.replace_screen_blocks(content, modified_blocks)
+    modified_content = screen.replace_screen_blocks(content, spans,
+                                                    modified_blocks)
 
     assert modified_content == (
         "<para>Some text</para>\n"
@@ -160,10 +165,12 @@ def test_replace_screen_blocks_with_prompt_and_replaceable():
         "</screen>\n"
         "<para>Other text</para>"
     )
-    screen_blocks = screen.extract_screen_blocks(content)
-    modified_blocks = [(block, screen.modify_screen_content(block))
+    spans = screen.find_screens(content)
+    screen_blocks = screen.extract_screen_blocks(content, spans)
+    modified_blocks = [screen.modify_screen_content(block)
                        for block in screen_blocks]
-    modified_content = screen.replace_screen_blocks(content, modified_blocks)
+    modified_content = screen.replace_screen_blocks(content, spans,
+                                                    modified_blocks)
 
     assert modified_content == (
         "<para>Some text</para>\n"
@@ -188,7 +195,27 @@ def test_replace_screen_blocks_with_command_cascades():
             <command>sudo</command>
             <command>zypper install docker-ce</command>
           </screen>"""
-    screen_blocks = screen.extract_screen_blocks(content)
-    modified_blocks = [(block, screen.modify_screen_content(block))
+    spans = screen.find_screens(content)
+    screen_blocks = screen.extract_screen_blocks(content, spans)
+    modified_blocks = [screen.modify_screen_content(block)
                        for block in screen_blocks]
-    modified_content = screen.replace_screen_blocks(content, modified_blocks)
+    modified_content = screen.replace_screen_blocks(content, spans,
+                                                    modified_blocks)
+
+
+def test_replace_screen_blocks_duplicates():
+    block = (
+        "<screen>\n"
+        "<prompt>&lt;</prompt>\n"
+        "  <command>ls</command>\n"
+        "</screen>"
+    )
+    content = f"<para>{block}</para>\n<para>A</para>\n  {block}\n"
+    spans = screen.find_screens(content)
+    modified_blocks = [screen.modify_screen_content(block)
+                       for block in screen.extract_screen_blocks(content, spans)]
+    modified_content = screen.replace_screen_blocks(content, spans,
+                                                    modified_blocks)
+
+    fixed = "<screen><prompt>&lt;</prompt><command>ls</command>\n</screen>"
+    assert modified_content == f"<para>{fixed}</para>\n<para>A</para>\n  {fixed}\n"
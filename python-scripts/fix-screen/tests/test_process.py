@@ -0,0 +1,68 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+import screen
+
+
+THISDIR = Path(__file__).parent
+
+
+def test_process_file_writes_only_changes(tmp_path):
+    xmlfile = tmp_path / "test-04.xml"
+    shutil.copy(str(THISDIR / "test-04.xml"), str(xmlfile))
+
+    assert screen.process_file(str(xmlfile)) == "changed"
+    mtime = os.stat(str(xmlfile)).st_mtime_ns
+    assert screen.process_file(str(xmlfile)) == "unchanged"
+    assert os.stat(str(xmlfile)).st_mtime_ns == mtime
+    assert os.listdir(str(tmp_path)) == ["test-04.xml"]
+
+
+def test_process_file_skipped():
+    assert screen.process_file(str(THISDIR / "test-01.xml")) == "skipped"
+
+
+def test_main_jobs(tmp_path, capsys):
+    files = []
+    for name in ("test-01.xml", "test-02.xml", "test-03.xml", "test-04.xml"):
+        shutil.copy(str(THISDIR / name), str(tmp_path / name))
+        files.append(str(tmp_path / name))
+    expected = [screen.fix_content((THISDIR / name).read_text())
+                for name in ("test-02.xml", "test-03.xml", "test-04.xml")]
+
+    screen.main(["--jobs", "2", *files])
+
+    assert [Path(f).read_text() for f in files[1:]] == expected
+    assert capsys.readouterr().err.splitlines()[-1] == (
+        "Changed 3 file(s), 0 unchanged, 1 without <screen>"
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 8, 13, 64, 1 << 16])
+def test_fix_stream(chunk_size):
+    import io
+
+    content = "".join((THISDIR / name).read_text()
+                      for name in ("test-01.xml", "test-02.xml",
+                                   "test-03.xml", "test-04.xml"))
+    content += "<screen/><screen>\n  <prompt>#</prompt>\n"
+    outstream = io.StringIO()
+
+    result = screen.fix_stream(io.StringIO(content), outstream,
+                               chunk_size=chunk_size)
+
+    # The unterminated <screen> at the end is copied as it is
+    assert outstream.getvalue() == screen.fix_content(content)
+    assert result == "changed"
+
+
+def test_fix_stream_unchanged():
+    import io
+
+    content = "<para/><screen>text</screen>"
+    outstream = io.StringIO()
+
+    assert screen.fix_stream(io.StringIO(content), outstream, chunk_size=3) == "unchanged"
+    assert outstream.getvalue() == content
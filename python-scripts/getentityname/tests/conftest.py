@@ -14,6 +14,13 @@ def add_semver(doctest_namespace):
     # doctest_namespace["gen"] = getentityname
     pass
 
+@pytest.fixture(autouse=True)
+def catalogcache(tmpdir, monkeypatch):
+    """Keep the persistent catalog cache inside the temporary directory"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir / "cache"))
+    gen.CATALOGCACHES.clear()
+
+
 @pytest.fixture
 def doctype():
     doctype, _ = gen.dtdmatcher()
@@ -1,3 +1,6 @@
+import os
+import shutil
+import subprocess
 from unittest import mock
 
 import pytest
@@ -82,14 +85,215 @@ def test_xmlcatalog_with_error_from_xmlcatalog():
             gen.xmlcatalog("https://www.example.com", "fake-catalog.xml", True)
 
 
-def test_xmlcatalog_with_():
+def test_xmlcatalog_with_broken_catalog(tmpdir):
     # given
-    mock_patch="gen.os.path.exists"
-    proc = gen.subprocess.CompletedProcess("fake", returncode=100,
-                                           stdout=b"", stderr=None)
+    catalogfile = (tmpdir / "catalog.xml")
+    catalogfile.write_text("<catalog", encoding="UTF-8")
 
-    with mock.patch(mock_patch) as mck:
-        with mock.patch("gen.subprocess.run") as mock_subprocess:
-            mck.return_value = True
-            mock_subprocess.return_value = proc
-            assert gen.xmlcatalog("https://www.example.com", "fake-catalog.xml") is None
+    # when/then
+    assert gen.xmlcatalog("https://www.example.com", str(catalogfile)) is None
+    with pytest.raises(gen.XMLCatalogError):
+        gen.xmlcatalog("https://www.example.com", str(catalogfile), True)
+
+
+def test_xmlcatalog_without_loaded_catalog(tmpdir):
+    # given
+    catalogfile = (tmpdir / "catalog.xml")
+    catalogfile.write_text("<catalog/>", encoding="UTF-8")
+
+    with mock.patch("gen.load_catalog", return_value=None):
+        # when/then
+        assert gen.xmlcatalog("https://www.example.com",
+                              str(catalogfile)) is None
+        with pytest.raises(gen.XMLCatalogError):
+            gen.xmlcatalog("https://www.example.com", str(catalogfile), True)
+
+
+@pytest.fixture
+def catalogtree(tmpdir):
+    """Creates a catalog tree with nextCatalog and delegate entries"""
+    ns = 'xmlns="urn:oasis:names:tc:entity:xmlns:xml:catalog"'
+    (tmpdir / "catalog.xml").write_text(f"""<catalog {ns}>
+  <delegatePublic publicIdStartString="-//DELEGATE//"
+                  catalog="delegate/catalog.xml"/>
+  <rewriteSystem systemIdStartString="http://www.example.org/rewrite/"
+                 rewritePrefix="file:///usr/share/rewritten/"/>
+  <rewriteSystem systemIdStartString="http://www.example.org/rewrite/long/"
+                 rewritePrefix="file:///usr/share/longest/"/>
+  <group xml:base="file:///usr/share/group/">
+    <system systemId="http://www.example.org/group.ent" uri="group.ent"/>
+  </group>
+  <nextCatalog catalog="next/catalog.xml"/>
+</catalog>""", encoding="UTF-8")
+    (tmpdir / "next").mkdir()
+    (tmpdir / "next" / "catalog.xml").write_text(f"""<catalog {ns}>
+  <public publicId="-//NEXT//ENTITIES Next//EN" uri="next.ent"/>
+  <rewriteURI uriStartString="urn:x-daps:" rewritePrefix="file:///usr/share/urn/"/>
+  <uri name="urn:x-daps:exact" uri="file:///usr/share/exact.xsl"/>
+</catalog>""", encoding="UTF-8")
+    (tmpdir / "delegate").mkdir()
+    (tmpdir / "delegate" / "catalog.xml").write_text(f"""<catalog {ns}>
+  <public publicId="-//DELEGATE//ENTITIES Found//EN" uri="found.ent"/>
+</catalog>""", encoding="UTF-8")
+    return tmpdir / "catalog.xml"
+
+
+CATALOGTREE_IDENTIFIERS = [
+    "-//DELEGATE//ENTITIES Found//EN",
+    "-//NEXT//ENTITIES Next//EN",
+    "http://www.example.org/rewrite/foo.ent",
+    "http://www.example.org/rewrite/long/foo.ent",
+    "http://www.example.org/group.ent",
+    "urn:x-daps:exact",
+    "urn:x-daps:style/fo.xsl",
+]
+
+
+@pytest.mark.parametrize("identifier", CATALOGTREE_IDENTIFIERS)
+def test_xmlcatalog_catalogtree(catalogtree, identifier):
+    # when
+    result = gen.xmlcatalog(identifier, str(catalogtree), raise_on_error=True)
+
+    # then
+    assert result.startswith(("/usr/share/", str(catalogtree.dirpath())))
+
+
+@pytest.mark.parametrize("identifier", [
+    # The delegated catalog doesn't know it, no fallback to nextCatalog
+    "-//DELEGATE//ENTITIES Missing//EN",
+    "-//UNKNOWN//ENTITIES Missing//EN",
+    "http://www.example.org/unknown.ent",
+])
+def test_xmlcatalog_catalogtree_not_found(catalogtree, identifier):
+    assert gen.xmlcatalog(identifier, str(catalogtree)) is None
+
+
+@pytest.mark.skipif(shutil.which("xmlcatalog") is None,
+                    reason="xmlcatalog command not available")
+@pytest.mark.parametrize("identifier", CATALOGTREE_IDENTIFIERS + [
+    "-//DELEGATE//ENTITIES Missing//EN",
+    "http://www.example.org/unknown.ent",
+])
+def test_xmlcatalog_same_as_command(catalogtree, identifier):
+    # given
+    proc = subprocess.run(["xmlcatalog", str(catalogtree), identifier],
+                          stdout=subprocess.PIPE)
+    expected = None
+    if not proc.returncode:
+        expected = proc.stdout.decode("UTF-8").split("file://")[-1].strip()
+
+    # when
+    result = gen.xmlcatalog(identifier, str(catalogtree))
+
+    # then
+    assert result == expected
+
+
+def test_load_catalog_only_once(catalogtree):
+    # given
+    gen.CATALOGS.clear()
+
+    # when
+    first = gen.load_catalog(str(catalogtree))
+    second = gen.load_catalog("file://" + str(catalogtree))
+
+    # then
+    assert first is second
+
+
+def test_catalogstamp_follows_catalog_references(catalogtree):
+    # when
+    stamp = gen.catalogstamp([str(catalogtree)])
+
+    # then
+    paths = [line.split(" ")[0] for line in stamp.splitlines()]
+    assert paths == [str(catalogtree),
+                     str(catalogtree.dirpath()) + "/delegate/catalog.xml",
+                     str(catalogtree.dirpath()) + "/next/catalog.xml",
+                     ]
+
+
+def test_catalogcache_roundtrip(catalogtree, tmpdir):
+    # given
+    cachedir = str(tmpdir / "cachedir")
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+
+    # when
+    cache.set("urn:x-daps:exact", "file:///usr/share/exact.xsl")
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+
+    # then
+    assert cache.get("urn:x-daps:exact") == "file:///usr/share/exact.xsl"
+
+
+def test_catalogcache_stores_paths_as_urls(catalogtree, tmpdir):
+    # given
+    cachedir = str(tmpdir / "cachedir")
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+    identifier = "-//NEXT//ENTITIES Next//EN"
+
+    # when
+    result = gen.xmlcatalog(identifier, str(catalogtree), cache=cache)
+    lines = open(cache.path, encoding="UTF-8").read().splitlines()
+
+    # then
+    assert result.startswith("/")
+    assert lines == ["%s\tfile://%s" % (identifier, result)]
+
+
+def test_catalogcache_invalidated_by_changed_catalog(catalogtree, tmpdir):
+    # given
+    cachedir = str(tmpdir / "cachedir")
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+    cache.set("urn:x-daps:exact", "file:///usr/share/exact.xsl")
+
+    # when
+    nextcatalog = catalogtree.dirpath() / "next" / "catalog.xml"
+    nextcatalog.write_text(nextcatalog.read_text("UTF-8") + "\n", "UTF-8")
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+
+    # then
+    assert cache.get("urn:x-daps:exact") is None
+
+
+def test_xmlcatalog_with_warm_cache_loads_no_catalog(catalogtree, tmpdir):
+    # given
+    cachedir = str(tmpdir / "cachedir")
+    identifier = "-//NEXT//ENTITIES Next//EN"
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+    expected = gen.xmlcatalog(identifier, str(catalogtree), cache=cache)
+
+    # when
+    cache = gen.CatalogCache([str(catalogtree)], cachedir)
+    with mock.patch("gen.load_catalog") as mck:
+        result = gen.xmlcatalog(identifier, str(catalogtree), cache=cache)
+
+    # then
+    assert result == expected
+    mck.assert_not_called()
+
+
+@pytest.mark.skipif(not os.access("/usr/bin/xmlcatalog", os.X_OK),
+                    reason="xml_cat_resolver needs /usr/bin/xmlcatalog")
+def test_xml_cat_resolver_uses_cache_of_getentityname(catalogtree, tmpdir,
+                                                       monkeypatch):
+    # given
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir / "cache"))
+    monkeypatch.setenv("XML_CATALOG_FILES", str(catalogtree))
+    monkeypatch.delenv(gen.CACHE_ENV, raising=False)
+    # Only the cache knows the identifier, xmlcatalog would fail
+    identifier = "urn:x-daps:cached"
+    cache = gen.CatalogCache([str(catalogtree)])
+    cache.set(identifier, "/usr/share/cached.xsl")
+    resolver = TESTDIR.parts()[-4] / "libexec" / "xml_cat_resolver"
+
+    # when
+    proc = subprocess.run([str(resolver), identifier], cwd=str(tmpdir),
+                          stdout=subprocess.PIPE, universal_newlines=True)
+
+    # then
+    assert proc.returncode == 0
+    assert proc.stdout == "file:///usr/share/cached.xsl\n"
+    assert gen.xmlcatalog(identifier, str(catalogtree),
+                          cache=gen.CatalogCache([str(catalogtree)])) == \
+        "/usr/share/cached.xsl"
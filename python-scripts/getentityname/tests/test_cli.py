@@ -1,3 +1,4 @@
+import json
 import re
 import pytest
 
@@ -40,3 +41,98 @@ def test_version(capsys):
 
     # then
     assert captured.out.rstrip() == gen.__version__
+
+
+def test_json_lines_with_manifest(capsys, tmpdir):
+    # given
+    (tmpdir / "a.ent").write_text("", encoding="UTF-8")
+    for name in ("a.xml", "b.xml"):
+        (tmpdir / name).write_text(
+            '<!DOCTYPE book [<!ENTITY % a SYSTEM "a.ent"> %a;]><book/>',
+            encoding="UTF-8")
+    (tmpdir / "broken.xml").write_text("<!DOCTYPE book [<book/>",
+                                       encoding="UTF-8")
+    manifest = tmpdir / "manifest"
+    manifest.write_text("# XML files\nb.xml\n\nbroken.xml\n", encoding="UTF-8")
+
+    # when
+    with tmpdir.as_cwd():
+        result = gen.main(["--json", "--manifest", str(manifest), "a.xml"])
+    lines = [json.loads(line)
+             for line in capsys.readouterr().out.splitlines()]
+
+    # then
+    assert result == 1
+    assert lines[0] == {"file": str(tmpdir / "a.xml"),
+                        "entities": [str(tmpdir / "a.ent")]}
+    assert lines[1] == {"file": str(tmpdir / "b.xml"),
+                        "entities": [str(tmpdir / "a.ent")]}
+    assert lines[2]["file"] == str(tmpdir / "broken.xml")
+    assert "error" in lines[2]
+
+
+def test_json_lines_with_unreadable_entity_files(capsys, tmpdir):
+    # given
+    (tmpdir / "good.ent").write_text("", encoding="UTF-8")
+    (tmpdir / "bad-comment.ent").write_text("<!-- a -- b -->",
+                                            encoding="UTF-8")
+    for name, entity in (("a.xml", "missing.ent"), ("b.xml", "good.ent"),
+                         ("c.xml", "bad-comment.ent")):
+        (tmpdir / name).write_text(
+            '<!DOCTYPE book [<!ENTITY %% e SYSTEM "%s"> %%e;]><book/>'
+            % entity, encoding="UTF-8")
+    (tmpdir / "d.xml").write_text(
+        "<!DOCTYPE book [<!-- a -- b -->]><book/>", encoding="UTF-8")
+
+    # when
+    with tmpdir.as_cwd():
+        result = gen.main(["--json", "a.xml", "b.xml", "c.xml", "d.xml"])
+    lines = [json.loads(line)
+             for line in capsys.readouterr().out.splitlines()]
+
+    # then
+    assert result == 1
+    assert [line["file"] for line in lines] == [
+        str(tmpdir / name) for name in ("a.xml", "b.xml", "c.xml", "d.xml")]
+    assert "missing.ent" in lines[0]["error"]
+    assert lines[1] == {"file": str(tmpdir / "b.xml"),
+                        "entities": [str(tmpdir / "good.ent")]}
+    assert "--" in lines[2]["error"]
+    assert "error" in lines[3]
+
+
+def test_absolute_is_deprecated(capsys, tmpdir):
+    # given
+    (tmpdir / "a.xml").write_text("<book/>", encoding="UTF-8")
+
+    # when
+    with tmpdir.as_cwd():
+        result = gen.main(["--absolute", "a.xml"])
+
+    # then
+    assert result == 0
+    assert "deprecated" in capsys.readouterr().err
+
+
+def test_no_short_json_option(capsys):
+    # given
+    # n/a
+
+    # when
+    with pytest.raises(SystemExit):
+        gen.main(["-j", "a.xml"])
+
+    # then
+    assert "-j" in capsys.readouterr().err
+
+
+def test_no_xmlfiles(capsys):
+    # given
+    # n/a
+
+    # when
+    with pytest.raises(SystemExit):
+        gen.main([])
+
+    # then
+    assert "Need at least one XML file" in capsys.readouterr().err
@@ -13,7 +13,9 @@ import gen
 def cliargs():
     """Simulates parsed CLI arguments"""
     return argparse.Namespace(absolute=False,
+                              cache=False,
                               catalog=gen.MAINCATALOG,
+                              full_check=False,
                               separator=' ',
                               skip_public=True,
                               verbose=1,
@@ -177,3 +179,140 @@ def test_skip_public_parameter_entity_in_investigate_identifiers(cliargs, caplog
             result = True
 
     assert result, "Could not find 'Skipping public...' inside log records"
+
+
+def write_xml(path, *entities):
+    """Write a minimal XML file referencing the local entity files"""
+    decls = "\n".join(f'<!ENTITY % e{i} SYSTEM "{ent}">\n%e{i};'
+                      for i, ent in enumerate(entities))
+    path.write_text(f"""<?xml version="1.0"?>
+<!DOCTYPE book [
+{decls}
+]>
+<book/>""", encoding="UTF-8")
+
+
+def test_build_entity_graph_nested(cliargs, tmpdir):
+    # given
+    xmlfile = tmpdir / "book.xml"
+    write_xml(xmlfile, "a.ent")
+    (tmpdir / "a.ent").write_text('<!ENTITY % b SYSTEM "sub/b.ent"> %b;',
+                                  encoding="UTF-8")
+    tmpdir.mkdir("sub")
+    (tmpdir / "sub" / "b.ent").write_text(
+        '<!-- <!ENTITY % x SYSTEM "x.ent"> -->'
+        '<!ENTITY % c SYSTEM "c.ent"> %c;', encoding="UTF-8")
+    (tmpdir / "sub" / "c.ent").write_text('<!ENTITY c "C">', encoding="UTF-8")
+    cliargs.xmlfiles = [str(xmlfile)]
+
+    # when
+    graph = gen.build_entity_graph(cliargs)
+
+    # then
+    assert [graph.nodes[key].path for key in graph.entities()] == [
+        str(tmpdir / "a.ent"),
+        str(tmpdir / "sub" / "b.ent"),
+        str(tmpdir / "sub" / "c.ent"),
+    ]
+    assert len(graph.dependencies(str(xmlfile))) == 3
+    assert graph.nodes[str(tmpdir / "a.ent")].origin == gen.ORIGIN_LOCAL
+
+
+def test_build_entity_graph_with_cycle(cliargs, tmpdir):
+    # given
+    xmlfile = tmpdir / "book.xml"
+    write_xml(xmlfile, "a.ent")
+    (tmpdir / "a.ent").write_text('<!ENTITY % b SYSTEM "b.ent">',
+                                  encoding="UTF-8")
+    (tmpdir / "b.ent").write_text('<!ENTITY % a SYSTEM "a.ent">',
+                                  encoding="UTF-8")
+    cliargs.xmlfiles = [str(xmlfile)]
+
+    # when
+    graph = gen.build_entity_graph(cliargs)
+
+    # then
+    assert graph.entities() == [str(tmpdir / "a.ent"), str(tmpdir / "b.ent")]
+    assert graph.edges[str(tmpdir / "b.ent")] == [str(tmpdir / "a.ent")]
+
+
+def test_build_entity_graph_same_file_via_symlink(cliargs, tmpdir):
+    # given
+    xmlfile = tmpdir / "book.xml"
+    write_xml(xmlfile, "a.ent", "link/a.ent", "./a.ent")
+    (tmpdir / "a.ent").write_text("", encoding="UTF-8")
+    (tmpdir / "link").mksymlinkto(tmpdir)
+    cliargs.xmlfiles = [str(xmlfile)]
+
+    # when
+    ents = gen.getentities(cliargs)
+
+    # then
+    assert list(ents) == [str(tmpdir / "a.ent")]
+
+
+def test_write_make_deps(cliargs, tmpdir):
+    # given
+    first, second = tmpdir / "a.xml", tmpdir / "b.xml"
+    write_xml(first, "a.ent")
+    write_xml(second)
+    (tmpdir / "a.ent").write_text('<!ENTITY % c SYSTEM "c.ent">',
+                                  encoding="UTF-8")
+    (tmpdir / "c.ent").write_text("", encoding="UTF-8")
+    cliargs.xmlfiles = [str(first), str(second)]
+    makefile = tmpdir / "deps.mk"
+
+    # when
+    gen.write_make_deps(gen.build_entity_graph(cliargs), str(makefile))
+
+    # then
+    assert makefile.read_text("UTF-8").splitlines() == [
+        f"ENTITIES_DEPS_{first} := {tmpdir / 'a.ent'} {tmpdir / 'c.ent'}",
+        f"ENTITIES_DEPS_{second} := ",
+    ]
+
+
+@pytest.mark.parametrize("prolog_only", [True, False])
+def test_xmlsyntaxcheck_error_in_prolog(tmpdir, prolog_only):
+    # given
+    xmlfile = tmpdir / "book.xml"
+    xmlfile.write_text("""<?xml version="1.0"?>
+<!DOCTYPE book [
+<!ENTITY % a SYSTEM "a.ent"
+]>
+<book/>""", encoding="UTF-8")
+
+    # when/then
+    with pytest.raises(gen.SAXParseException) as error:
+        gen.xmlsyntaxcheck(str(xmlfile), prolog_only=prolog_only)
+    assert error.value.getLineNumber() == 4
+
+
+def test_xmlsyntaxcheck_error_after_prolog(tmpdir):
+    # given
+    xmlfile = tmpdir / "book.xml"
+    xmlfile.write_text("""<?xml version="1.0"?>
+<!DOCTYPE book [
+<!ENTITY % a SYSTEM "a.ent">
+]>
+<book>""" + "<para>x</para>" * 100000 + "<para></book>", encoding="UTF-8")
+
+    # when
+    gen.xmlsyntaxcheck(str(xmlfile), prolog_only=True)
+
+    # then
+    with pytest.raises(gen.SAXParseException):
+        gen.xmlsyntaxcheck(str(xmlfile), prolog_only=False)
+
+
+def test_xmlsyntaxcheck_without_root_element(tmpdir):
+    # given
+    xmlfile = tmpdir / "book.xml"
+    xmlfile.write_text("""<?xml version="1.0"?>
+<!DOCTYPE book [
+<!ENTITY % a SYSTEM "a.ent">
+]>""", encoding="UTF-8")
+
+    # when/then
+    with pytest.raises(gen.SAXParseException):
+        gen.xmlsyntaxcheck(str(xmlfile), prolog_only=True)
@@ -1,4 +1,7 @@
+import io
+import mmap
 import re
+
 import pytest
 
 # "gen" is the abbreviated name for "getentityname.py"
@@ -15,6 +18,110 @@ def test_should_raise_valueerror_in_rm_xml_comment_with_doubledashes():
         gen.remove_xml_comments("<!-- Not--allowed-->")
 
 
+def generate_internal_subset(comments):
+    """Generate an internal subset with commented-out entity blocks"""
+    return "".join(
+        f'<!--\n<!ENTITY % e{i} SYSTEM "e{i}.ent">\n%e{i};\n-->\n'
+        f'<!ENTITY x{i} "X">\n'
+        for i in range(comments)
+    )
+
+
+def test_remove_xml_comments_with_many_comments():
+    content = generate_internal_subset(10_000)
+    result = gen.remove_xml_comments(content)
+    assert "<!--" not in result
+    assert result.count("<!ENTITY x") == 10_000
+
+
+class CountingStr(str):
+    """A string which counts the characters its find() method scans"""
+
+    def __new__(cls, content):
+        self = super().__new__(cls, content)
+        self.scanned = 0
+        return self
+
+    def find(self, sub, start=0, end=None):
+        end = len(self) if end is None else end
+        result = super().find(sub, start, end)
+        self.scanned += (end if result == -1 else result + len(sub)) - start
+        return result
+
+
+@pytest.mark.parametrize("comments", [1_000, 10_000, 40_000])
+def test_remove_xml_comments_scans_linear(comments):
+    # Each character is scanned at most twice: once to find the
+    # comments and once to check for "--" inside them. The former
+    # implementation (rebuilding the string per comment) scanned the
+    # rest of the content again for every comment.
+    content = CountingStr(generate_internal_subset(comments))
+    gen.remove_xml_comments(content)
+    assert content.scanned <= 2 * len(content)
+
+
+PROLOG = """<?xml version="1.0" encoding="UTF-8"?>
+<?xml-stylesheet href="x.xsl" type="text/xsl"?>
+<!-- <!DOCTYPE fake> -->
+<!DOCTYPE book PUBLIC "-//OASIS//DTD DocBook XML V4.5//EN" "docbookx.dtd"
+[
+<!-- ]> in a comment -->
+<!ENTITY product "]> in a literal">
+<?pi ]> in a PI?>
+%s
+] >"""
+
+
+@pytest.mark.parametrize("blocksize", [1, 2, 7, 4096])
+def test_read_prolog_with_blocksizes(blocksize):
+    prolog = PROLOG % generate_internal_subset(100)
+    content = (prolog + "\n<book>]></book>").encode("UTF-8")
+    assert gen.read_prolog(io.BytesIO(content), blocksize) == prolog
+
+
+def test_read_prolog_reads_only_the_prolog():
+    prolog = PROLOG % ""
+    stream = io.BytesIO((prolog + "<book/>" + " " * 100_000).encode("UTF-8"))
+    gen.read_prolog(stream, blocksize=64)
+    assert stream.tell() < len(prolog) + 64
+
+
+def test_read_prolog_from_buffers(tmpdir):
+    prolog = PROLOG % generate_internal_subset(100)
+    xmlfile = tmpdir / "book.xml"
+    xmlfile.write_text(prolog + "\n<book/>", encoding="UTF-8")
+    with open(str(xmlfile), "rb") as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            assert gen.read_prolog(mm) == prolog
+    assert gen.read_prolog(xmlfile.read_binary(), 16) == prolog
+
+
+@pytest.mark.parametrize("content, expected", [
+    # no DOCTYPE
+    ("<?xml version='1.0'?>\n<book/>", "<?xml version='1.0'?>\n"),
+    # no internal subset
+    ("<!DOCTYPE book SYSTEM 'book.dtd'><book/>",
+     "<!DOCTYPE book SYSTEM 'book.dtd'>"),
+    # truncated file
+    ("<!DOCTYPE book [ <!ENTITY a 'A'>", "<!DOCTYPE book [ <!ENTITY a 'A'>"),
+    # encoding
+    ("<?xml version='1.0' encoding='ISO-8859-1'?><!DOCTYPE b\xe4r>",
+     "<?xml version='1.0' encoding='ISO-8859-1'?><!DOCTYPE b\xe4r>"),
+])
+def test_read_prolog(content, expected):
+    encoding = "ISO-8859-1" if "ISO" in content else "UTF-8"
+    assert gen.read_prolog(io.BytesIO(content.encode(encoding))) == expected
+
+
+def test_internal_subset_longer_than_50_lines(tmpdir):
+    xmlfile = tmpdir / "book.xml"
+    xmlfile.write_text(
+        "<!DOCTYPE book [\n%s<!ENTITY %% last SYSTEM 'last.ent'>\n]>\n<book/>"
+        % generate_internal_subset(100), encoding="UTF-8")
+    subset = gen.internal_subset(str(xmlfile))
+    assert "last.ent" in subset
+
+
 @pytest.mark.parametrize("space", [
     # space
     " ",
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# startup-benchmark.py - Measure the cold-start time of the libexec scripts
+#
+# Runs each Python script of libexec with "python -X importtime" several
+# times, in turn with "python -c pass" as a baseline on the same host.
+# Reports the medians of the import time and the wall time each script
+# needs beyond the baseline.
+#
+# Fails with exit code 1 if a script loads a module it doesn't need for
+# the arguments (like lxml for --version), or if its extra import time
+# exceeds its budget. Budgets are multiples of the baseline wall time, so
+# they scale with the speed of the host.
+#
+# Usage: startup-benchmark.py [REPEAT] [SCALE]
+#
+# REPEAT is the number of runs per script (default: 15), SCALE multiplies
+# all budgets (default: 1.0).
+
+import os.path
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LIBEXEC = os.path.join(os.path.dirname(HERE), "libexec")
+
+# (script, arguments, import time budget in baseline wall times,
+#  modules it must not load)
+CASES = [
+    ("daps-xmlwellformed", ["--version"], 5, ["lxml.etree", "multiprocessing"]),
+    ("daps-xmlwellformed", ["--help"], 5, ["lxml.etree", "multiprocessing"]),
+    ("getentityname.py", ["--version"], 6, ["logging.config"]),
+    ("validate-tables.py", [], 7, ["multiprocessing"]),
+    ("daps-pyd", ["--version"], 5, ["lxml.etree"]),
+]
+
+
+def import_times(stderr):
+    """Return the total import time in microseconds and the module names"""
+    total = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip())
+        # Only count top-level imports, the others are part of them
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total, modules
+
+
+def run(args):
+    """Run the Python interpreter once with -X importtime
+
+    :param list args: the arguments of the interpreter
+    :return: the import time and wall time in ms and the module names
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    wall = (time.perf_counter() - start) * 1000
+    total, modules = import_times(proc.stderr)
+    return total / 1000, wall, modules
+
+
+def measure(commands, repeat):
+    """Run all commands in turn, repeat times
+
+    Interleaving the runs spreads changes of the load of the host over
+    all commands alike.
+
+    :param list commands: the arguments of the interpreter per command
+    :param int repeat: the number of runs per command
+    :return: the median import time and wall time in ms and the module
+             names for each command
+    """
+    runs = [[run(args) for args in commands] for _ in range(repeat)]
+    return [(statistics.median(imported for imported, _, _ in results),
+             statistics.median(wall for _, wall, _ in results),
+             set().union(*(modules for _, _, modules in results)))
+            for results in zip(*runs)]
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    scale = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    baseline, *results = measure(
+        [["-c", "pass"]] + [[os.path.join(LIBEXEC, script), *args]
+                            for script, args, _, _ in CASES],
+        repeat)
+    base_import, base_wall, _ = baseline
+    print("baseline (python -c pass): import %.1f ms, wall %.1f ms, "
+          "median of %d runs" % (base_import, base_wall, repeat))
+    print("%-32s %10s %10s %10s" % ("script", "+import ms", "budget",
+                                    "+wall ms"))
+    failed = 0
+    for (script, args, budget, forbidden), (imported, wall, modules) in \
+            zip(CASES, results):
+        imported -= base_import
+        wall -= base_wall
+        budget *= scale * base_wall
+        problems = ["loads %s" % name for name in forbidden if name in modules]
+        if imported > budget:
+            problems.append("over budget")
+        print("%-32s %10.1f %10.1f %10.1f  %s" % (
+            " ".join([script, *args]), imported, budget, wall,
+            ", ".join(problems) or "ok"))
+        failed += bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+#
+# benchmark.py - Measure the per-cell cost of validate-tables.py
+#
+# Generates one large CALS and one large HTML table and reports the time
+# check_table() needs for each of them.
+#
+# Usage: benchmark.py [CELLS] [REPEAT] [COLUMNS]
+
+import importlib.util
+import os.path
+import sys
+import timeit
+
+from lxml import etree
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location(
+    'validate_tables', os.path.join(HERE, 'bin', 'validate-tables.py'))
+vt = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(vt)
+
+def cals_table(rows, cols):
+    """Generate DocBook 5 CALS table with rows * cols cells"""
+    entries = '<entry><para>x</para></entry>' * cols
+    return ('<table xmlns="http://docbook.org/ns/docbook"><title>T</title>'
+        '<tgroup cols="%d"><colspec colname="c1"/><thead><row>%s</row></thead>'
+        '<tbody>%s</tbody></tgroup></table>'
+        % (cols, entries, ('<row>%s</row>' % entries) * (rows - 1)))
+
+def html_table(rows, cols):
+    """Generate DocBook 5 HTML table with rows * cols cells"""
+    cells = '<td>x</td>' * cols
+    return ('<informaltable xmlns="http://docbook.org/ns/docbook">'
+        '<tbody>%s</tbody></informaltable>' % (('<tr>%s</tr>' % cells) * rows))
+
+def main():
+    cells = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    cols = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    for name, generator in (('CALS', cals_table), ('HTML', html_table)):
+        table = etree.fromstring(generator(cells // cols, cols))
+        best = min(timeit.repeat(lambda: vt.check_table(table),
+            number=1, repeat=repeat))
+        print('%s table, %d x %d cells: %.3f s, %.2f us per cell'
+            % (name, cells // cols, cols, best, best / cells * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import pytest
+
+# "vt" is the abbreviated name for validate-tables.py
+# We can't import a name with a "-" so we use a link here:
+import vt
+
+# A CALS table with a hole in its second row and a valid one
+TABLES = """<informaltable><tgroup cols="2"><tbody>
+  <row><entry>a</entry><entry>b</entry></row>
+  <row><entry>c</entry></row>
+ </tbody></tgroup></informaltable>
+ <informaltable><tgroup cols="2"><tbody>
+  <row><entry>a</entry><entry>b</entry></row>
+ </tbody></tgroup></informaltable>
+"""
+
+
+@pytest.fixture
+def books(tmp_path, monkeypatch):
+    """Two books with several tables and a book that isn't well-formed"""
+    for name, count in (("one.xml", 10), ("two.xml", 3)):
+        (tmp_path / name).write_text(
+            '<book xmlns="http://docbook.org/ns/docbook">\n'
+            + TABLES * count + "</book>\n", encoding="UTF-8")
+    (tmp_path / "broken.xml").write_text("<book>\n", encoding="UTF-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def check(capsys, filenames, jobs, fmt="text"):
+    """Return exit code, stdout, and stderr without tracebacks"""
+    ret = vt.check_files(filenames, jobs=jobs, fmt=fmt)
+    out, err = capsys.readouterr()
+    return ret, out, err.split("Traceback")[0]
+
+
+@pytest.mark.parametrize("fmt", ["text", "jsonl"])
+@pytest.mark.parametrize("jobs", [2, 4, 64])
+@pytest.mark.parametrize("filenames", [
+    ["one.xml"], ["one.xml", "two.xml"], ["broken.xml", "two.xml"],
+])
+def test_jobs_same_as_serial(books, capsys, filenames, jobs, fmt):
+    # Given
+    expected = check(capsys, filenames, 1, fmt)
+
+    # When
+    result = check(capsys, filenames, jobs, fmt)
+
+    # Then
+    assert result == expected
+
+
+@pytest.mark.skipif(not vt.can_fork(), reason="needs the fork start method")
+def test_split_file_is_parsed_once(books, capsys, monkeypatch):
+    # Given
+    parsed = []
+    parse_file = vt.parse_file
+
+    def counting_parse_file(filename):
+        parsed.append(filename)
+        return parse_file(filename)
+
+    monkeypatch.setattr(vt, "parse_file", counting_parse_file)
+
+    # When
+    ret = vt.check_files(["one.xml"], jobs=4)
+
+    # Then
+    assert ret == 1
+    assert parsed == ["one.xml"]
+    assert capsys.readouterr().err.count("Errors in table:") == 10
@@ -0,0 +1,127 @@
+import json
+
+import pytest
+
+# "vt" is the abbreviated name for validate-tables.py
+# We can't import a name with a "-" so we use a link here:
+import vt
+
+TABLES = """<informaltable>
+  <tgroup cols="2"><tbody>
+   <row><entry>a</entry><entry>b</entry></row>
+   <row><entry>c</entry></row>
+  </tbody></tgroup>
+ </informaltable>
+ <informaltable>
+  <tr><td>a</td><td>b</td><td>c</td></tr>
+  <tr><td colspan="2">d</td></tr>
+ </informaltable>
+ <informaltable>
+  <tgroup cols="1"><tbody>
+   <row><entry>valid</entry></row>
+  </tbody></tgroup>
+ </informaltable>
+ <informaltable>
+  <tgroup cols="1"><tbody/></tgroup>
+ </informaltable>"""
+
+RECORD_TYPES = dict(file=str, line=int, tag=(str, type(None)),
+                    block=(str, type(None)), row=(int, type(None)),
+                    kind=str, message=str, rendering=(str, type(None)))
+
+
+def write_book(path, before=""):
+    path.write_text(
+        '<book xmlns="http://docbook.org/ns/docbook">\n'
+        f'{before}{TABLES}\n</book>\n', encoding="UTF-8")
+
+
+def check(capsys, filename, cachedir=None, fmt="text", stream=False):
+    """Return exit code and output"""
+    ret = vt.check_files([filename], stream=stream, cachedir=cachedir,
+                         fmt=fmt)
+    out, err = capsys.readouterr()
+    return ret, out + err
+
+
+@pytest.mark.parametrize("fmt", ["text", "jsonl"])
+def test_cache_replay_with_shifted_lines(tmp_path, capsys, monkeypatch, fmt):
+    # Given
+    book = tmp_path / "book.xml"
+    cachedir = str(tmp_path / "cache")
+    write_book(book)
+    first = check(capsys, str(book), cachedir, fmt)
+    write_book(book, before="<title>Moved</title>\n\n\n")
+    expected = check(capsys, str(book), None, fmt)
+    checked = []
+    monkeypatch.setattr(vt, "check_table", checked.append)
+
+    # When
+    result = check(capsys, str(book), cachedir, fmt)
+
+    # Then
+    assert checked == []
+    assert result == expected
+    assert result != first
+
+
+def test_cache_miss_for_changed_table(tmp_path, capsys):
+    # Given
+    book = tmp_path / "book.xml"
+    cachedir = str(tmp_path / "cache")
+    write_book(book)
+    first = check(capsys, str(book), cachedir)
+    book.write_text(book.read_text("UTF-8").replace(
+        "<row><entry>c</entry></row>",
+        "<row><entry>c</entry><entry>d</entry></row>"), "UTF-8")
+
+    # When
+    result = check(capsys, str(book), cachedir)
+
+    # Then
+    assert result == check(capsys, str(book))
+    assert first[1].count("Holes in row 2") == 2
+    assert result[1].count("Holes in row 2") == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_jsonl_schema(tmp_path, capsys, stream):
+    # Given
+    book = tmp_path / "book.xml"
+    write_book(book)
+
+    # When
+    ret, out = check(capsys, str(book), fmt="jsonl", stream=stream)
+
+    # Then
+    records = [json.loads(line) for line in out.splitlines()]
+    assert ret == 1
+    assert [record["kind"] for record in records] == [
+        "holes", "holes", "structure"]
+    for record in records:
+        assert set(record) == set(RECORD_TYPES)
+        for key, types in RECORD_TYPES.items():
+            assert isinstance(record[key], types), key
+        assert record["file"] == str(book)
+        assert record["kind"] in (*vt.layout_messages, "structure")
+        if record["kind"] == "structure":
+            assert record["block"] is record["row"] is None
+        else:
+            assert record["rendering"]
+
+
+def test_jsonl_schema_parse_error(tmp_path, capsys):
+    # Given
+    book = tmp_path / "book.xml"
+    book.write_text("<book>\n<para>\n</book>\n", encoding="UTF-8")
+
+    # When
+    ret, out = check(capsys, str(book), fmt="jsonl")
+
+    # Then
+    record = json.loads(out.split("Error checking file")[0])
+    assert ret == 2
+    assert set(record) == set(RECORD_TYPES)
+    assert record["kind"] == "parse-error"
+    assert record["file"] == str(book)
+    assert record["line"] == 3
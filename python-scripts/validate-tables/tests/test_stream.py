@@ -0,0 +1,136 @@
+import pytest
+
+# "vt" is the abbreviated name for validate-tables.py
+# We can't import a name with a "-" so we use a link here:
+import vt
+
+DOCBOOK = 'xmlns="http://docbook.org/ns/docbook" ' \
+    'xmlns:xi="http://www.w3.org/2001/XInclude"'
+
+# An HTML table with a hole in its second row
+BROKEN_TABLE = """<informaltable>
+  <tr><td>a</td><td>b</td></tr>
+  <tr><td>c</td></tr>
+ </informaltable>"""
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('<?xml version="1.0"?>\n' + content, encoding="UTF-8")
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    """A book with includes from the same and from other directories,
+    one of them nested, and a missing include with a fallback"""
+    write(tmp_path / "ch.xml", f"""<chapter {DOCBOOK}>
+ <title>Same directory</title>
+ {BROKEN_TABLE}
+</chapter>""")
+    write(tmp_path / "sub" / "ch.xml", f"""<chapter {DOCBOOK}>
+ <title>Other directory</title>
+ {BROKEN_TABLE}
+ <xi:include href="sec.xml"/>
+ <xi:include href="../ch.xml"/>
+</chapter>""")
+    write(tmp_path / "sub" / "sec.xml", f"""<section {DOCBOOK}>
+ <title>Nested</title>
+ {BROKEN_TABLE}
+</section>""")
+    write(tmp_path / "book.xml", f"""<book {DOCBOOK}>
+ <title>Book</title>
+ <xi:include href="ch.xml"/>
+ <xi:include href="sub/ch.xml"/>
+ <xi:include href="missing.xml">
+  <xi:fallback>
+   {BROKEN_TABLE}
+  </xi:fallback>
+ </xi:include>
+ <xi:include href="ch.xml">
+  <xi:fallback>
+   <para>Not used</para>
+   {BROKEN_TABLE}
+  </xi:fallback>
+ </xi:include>
+</book>""")
+    write(tmp_path / "nofallback.xml", f"""<book {DOCBOOK}>
+ <title>Book</title>
+ <xi:include href="missing.xml"/>
+</book>""")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def check(capsys, filename, stream, fmt="text"):
+    """Return exit code, stdout, and stderr without tracebacks"""
+    ret = vt.check_files([filename], stream=stream, fmt=fmt)
+    out, err = capsys.readouterr()
+    return ret, out, err.split("Traceback")[0]
+
+
+@pytest.mark.parametrize("fmt", ["text", "jsonl"])
+@pytest.mark.parametrize("filename", [
+    "book.xml", "./book.xml", "sub/../book.xml", "nofallback.xml",
+])
+def test_stream_same_as_dom(book, capsys, filename, fmt):
+    # Given
+    expected = check(capsys, filename, False, fmt)
+
+    # When
+    result = check(capsys, filename, True, fmt)
+
+    # Then
+    assert result == expected
+
+
+def test_stream_same_as_dom_from_subdirectory(book, capsys, monkeypatch):
+    # Given
+    monkeypatch.chdir(book / "sub")
+    expected = check(capsys, "../book.xml", False)
+
+    # When
+    result = check(capsys, "../book.xml", True)
+
+    # Then
+    assert result == expected
+
+
+def test_stream_locations(book, capsys):
+    # When
+    ret, _, err = check(capsys, "book.xml", True)
+
+    # Then
+    assert ret == 1
+    # Included content from the same directory keeps the base of the
+    # including element, like after xinclude(); the line is the one in
+    # the included file
+    assert [line.split(" ")[0] for line in err.splitlines()
+            if line.endswith("Errors in table:")] == [
+        "book.xml:4:", "sub/ch.xml:4:", "sub/ch.xml:4:", "ch.xml:4:",
+        "book.xml:8:", "book.xml:4:"]
+
+
+def test_stream_missing_include_without_fallback(book, capsys):
+    # When
+    ret, _, err = check(capsys, "nofallback.xml", True)
+
+    # Then
+    assert ret == 2
+    assert err.startswith("could not load missing.xml, and no fallback "
+                          "was found, line 4\n")
+
+
+def test_stream_tables_removes_checked_content(tmp_path):
+    # Given
+    book = tmp_path / "book.xml"
+    write(book, f"<book {DOCBOOK}>\n" + BROKEN_TABLE * 4000 + "\n</book>")
+
+    # When
+    sizes = [len(list(table.getroottree().iter()))
+             for table in vt.stream_tables(str(book))]
+
+    # Then
+    # The book has 28001 elements; besides the current table, the tree
+    # only holds the content of the last chunk read by the parser
+    assert len(sizes) == 4000
+    assert max(sizes) < 2800
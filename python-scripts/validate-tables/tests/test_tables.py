@@ -0,0 +1,215 @@
+import random
+
+from lxml import etree
+import pytest
+
+# "vt" is the abbreviated name for validate-tables.py
+# We can't import a name with a "-" so we use a link here:
+import vt
+
+DB5 = "http://docbook.org/ns/docbook"
+
+
+def test_childindex_docbook4_and_docbook5():
+    # Given
+    node = etree.fromstring(
+        f'<row xmlns:d="{DB5}" xmlns:o="urn:other">'
+        '<entry/><d:entry/><o:entry/><entrytbl/><!-- comment --><d:entry/>'
+        '</row>')
+
+    # When
+    children = vt.ChildIndex(node)
+
+    # Then
+    assert [vt.local_name(child.tag)
+            for child in children.select("entry", "entrytbl")] == \
+        ["entry", "entry", "entrytbl", "entry"]
+    assert children.select("entry") == [node[0], node[1], node[5]]
+    assert children.select("tbody") == []
+    assert children.optional("entrytbl") is node[3]
+    assert children.optional("thead") is None
+
+
+def test_childindex_optional_more_than_once():
+    # Given
+    children = vt.ChildIndex(etree.fromstring(
+        "<tgroup><thead/><thead/></tgroup>"))
+
+    # When/Then
+    with pytest.raises(vt.DocBookError, match="too many results: thead"):
+        children.optional("thead")
+
+
+def test_cellgrid_spans():
+    # Given
+    grid = vt.CellGrid(3, 3)
+
+    # When
+    grid.occupy(0, 0, 2, 1)
+    grid.occupy(0, 1, 1, 2)
+    grid.occupy(1, 1, 2, 2)
+    grid.occupy(2, 0, 1, 1)
+
+    # Then
+    assert grid.is_valid(3)
+    assert grid.first_free(1, 0) == 3
+    assert [grid.row(rpos) for rpos in range(3)] == [b"\1\1\1"] * 3
+
+
+def test_cellgrid_overflow_and_intersection():
+    # Given
+    grid = vt.CellGrid(2, 2)
+
+    # When
+    grid.occupy(0, 1, 2, 3)
+    grid.occupy(1, 0, 1, 2)
+
+    # Then
+    assert len(grid) == 2
+    assert grid.width > 2
+    assert grid.row(0) == b"\0\1\1\1"
+    assert grid.row(1) == b"\1\2\1\1"
+    assert not grid.is_valid(2)
+    assert vt.validate_cells(grid, 2, 2) == [
+        ("column-overflow", 1), ("holes", 1),
+        ("column-overflow", 2), ("intersecting-cells", 2)]
+
+
+def test_cellgrid_rowspan_overflow():
+    # Given
+    grid = vt.expand_cells(None, [[(None, 3, 1), (None, 1, 1)]], 2)
+
+    # When
+    errors = vt.validate_cells(grid, 1, 2)
+
+    # Then
+    assert len(grid) == 3
+    assert errors == [("rowspan-overflow", None)]
+
+
+@pytest.mark.parametrize("span", ["0", "-1"])
+def test_colgroup_without_columns(span):
+    # Given
+    table = etree.fromstring(
+        f'<informaltable><colgroup span="{span}"/>'
+        '<tr><td>x</td><td>y</td></tr></informaltable>')
+
+    # When
+    with pytest.raises(vt.DocBookError) as err:
+        vt.check_table(table)
+
+    # Then
+    assert [(issue["kind"], issue["row"]) for issue in err.value.issues] == \
+        [("column-overflow", 1)]
+
+
+def reference_layout(rows, colcount):
+    """
+    Straightforward layout of the cells (rowspan, colspan) of each row, as
+    a list of lists of cell counts. Cells beyond the end of a row are
+    appended to it.
+    """
+    height = max([len(rows)] + [rpos + rspan for rpos, row in enumerate(rows)
+                                for rspan, _ in row])
+    grid = [[0] * colcount for _ in range(height)]
+    for rpos, row in enumerate(rows):
+        cpos = 0
+        for rspan, cspan in row:
+            while cpos < len(grid[rpos]) and grid[rpos][cpos]:
+                cpos += 1
+            for y in range(rpos, rpos + rspan):
+                for x in range(cpos, cpos + cspan):
+                    if x >= len(grid[y]):
+                        x = len(grid[y])
+                        grid[y].append(0)
+                    grid[y][x] += 1
+            cpos += cspan
+    return grid
+
+
+def reference_errors(rows, colcount):
+    """Layout errors of a table block as (kind, row), see validate_cells()"""
+    grid = reference_layout(rows, colcount)
+    errors = []
+    if len(grid) > len(rows):
+        errors.append(("rowspan-overflow", None))
+    for rpos, row in enumerate(grid[:len(rows)], 1):
+        if len(row) > colcount:
+            errors.append(("column-overflow", rpos))
+        if 0 in row:
+            errors.append(("holes", rpos))
+        if any(count > 1 for count in row):
+            errors.append(("intersecting-cells", rpos))
+    return errors
+
+
+def random_table(rnd):
+    """
+    Random HTML table: column count and rows of (rowspan, colspan).
+    The cells fill the table; then one row may get a changed span, a
+    missing cell, or an additional cell.
+    """
+    colcount, rowcount = rnd.randint(1, 5), rnd.randint(1, 6)
+    taken = set()
+    rows = []
+    for rpos in range(rowcount):
+        row = []
+        for cpos in range(colcount):
+            if (rpos, cpos) in taken:
+                continue
+            cspan = 1
+            while cpos + cspan < colcount and \
+                    (rpos, cpos + cspan) not in taken and rnd.random() < 0.3:
+                cspan += 1
+            rspan = 1
+            while rpos + rspan < rowcount and rnd.random() < 0.3:
+                rspan += 1
+            taken.update((y, x) for y in range(rpos, rpos + rspan)
+                         for x in range(cpos, cpos + cspan))
+            row.append((rspan, cspan))
+        rows.append(row)
+
+    rpos = rnd.randrange(rowcount)
+    row = rows[rpos]
+    change = rnd.choice(("none", "rowspan", "colspan", "remove", "add"))
+    if change in ("rowspan", "colspan") and row:
+        cpos = rnd.randrange(len(row))
+        rspan, cspan = row[cpos]
+        if change == "rowspan":
+            rspan = max(1, rspan + rnd.choice((-1, 1)))
+        else:
+            cspan = max(1, cspan + rnd.choice((-1, 1)))
+        row[cpos] = (rspan, cspan)
+    elif change == "remove" and row:
+        del row[rnd.randrange(len(row))]
+    elif change == "add":
+        row.insert(rnd.randint(0, len(row)), (1, 1))
+    # A row needs a cell
+    rows = [row or [(1, 1)] for row in rows]
+    return colcount, rows
+
+
+def html_table(colcount, rows):
+    cells = "".join(
+        "<tr>%s</tr>" % "".join('<td rowspan="%d" colspan="%d"/>' % cell
+                                for cell in row)
+        for row in rows)
+    return etree.fromstring(f'<informaltable xmlns="{DB5}">{"<col/>" * colcount}'
+                            f'<tbody>{cells}</tbody></informaltable>')
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_layout_same_as_reference(seed):
+    # Given
+    colcount, rows = random_table(random.Random(seed))
+    expected = reference_errors(rows, colcount)
+
+    # When
+    try:
+        vt.check_table(html_table(colcount, rows))
+        result = []
+    except vt.DocBookError as err:
+        result = [(issue["kind"], issue["row"]) for issue in err.issues]
+
+    # Then
+    assert result == expected
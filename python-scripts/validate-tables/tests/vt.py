@@ -0,0 +1 @@
+../bin/validate-tables.py
\ No newline at end of file